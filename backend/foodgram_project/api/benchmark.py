@@ -0,0 +1,108 @@
+'''
+Helpers shared by the bench-* management commands.
+
+Benchmarks create their data inside a transaction which is rolled back
+at the end, so they can be pointed at a development database safely.
+'''
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+
+@contextmanager
+def rolled_back():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def measure(func, repeat):
+    '''Call func repeat times, return the list of durations in seconds.'''
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def percentile(timings, share):
+    ordered = sorted(timings)
+    index = min(len(ordered) - 1, round(share * (len(ordered) - 1)))
+    return ordered[index]
+
+
+def summary(timings):
+    '''Timings summary in milliseconds.'''
+    return {
+        'min': min(timings) * 1000,
+        'p50': statistics.median(timings) * 1000,
+        'p95': percentile(timings, 0.95) * 1000,
+        'max': max(timings) * 1000,
+    }
+
+
+def format_summary(label, timings):
+    stats = summary(timings)
+    return (f'{label:<32} min {stats["min"]:9.3f} ms  '
+            f'p50 {stats["p50"]:9.3f} ms  p95 {stats["p95"]:9.3f} ms')
+
+
+def peak_memory(func):
+    '''Peak size in bytes of memory allocated while func runs.'''
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def profile(func, repeat):
+    '''
+    Timings summary, the largest number of queries of a call and the
+    peak memory of func. The first call is traced for memory only, which
+    also warms up caches.
+    '''
+    peak = peak_memory(func)
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        queries = max(queries, len(captured))
+    return {**summary(timings), 'queries': queries, 'peak_kib': peak / 1024}
+
+
+def compare(results, baseline, max_slowdown, min_delta_ms,
+            max_extra_queries, max_memory_growth):
+    '''
+    Regressions of results against baseline, both {name: profile()}:
+    median slower by more than max_slowdown times and min_delta_ms, more
+    than max_extra_queries additional queries or peak memory grown more
+    than max_memory_growth times and 64 KiB.
+    '''
+    regressions = []
+    for name, new in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        # the median, p95 of a few calls is mostly noise
+        if (new['p50'] > old['p50'] * max_slowdown
+                and new['p50'] - old['p50'] > min_delta_ms):
+            regressions.append(f'{name}: p50 {old["p50"]:.1f} ms -> '
+                               f'{new["p50"]:.1f} ms')
+        if new['queries'] > old['queries'] + max_extra_queries:
+            regressions.append(f'{name}: {old["queries"]} -> '
+                               f'{new["queries"]} queries')
+        if (new['peak_kib'] > old['peak_kib'] * max_memory_growth
+                and new['peak_kib'] - old['peak_kib'] > 64):
+            regressions.append(f'{name}: peak memory {old["peak_kib"]:.0f} '
+                               f'KiB -> {new["peak_kib"]:.0f} KiB')
+    return regressions
@@ -0,0 +1,61 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes import versions
+
+
+class VersionedCacheMixin:
+    '''
+    Response cache for read-only viewsets of reference data which is the
+    same for every user.
+
+    Serialized data is stored in the Django cache under a key built from
+    the data version (see recipes.versions), so a change of the model
+    makes all its cached responses unreachable at once. Responses carry
+    ETag, Last-Modified and Cache-Control headers, and conditional
+    requests from nginx or browsers are answered with 304.
+    '''
+
+    cache_version_name = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request,
+                                    *args, **kwargs)
+
+    def get_cache_key(self, request, version):
+        return ':'.join(['response', self.basename, str(version),
+                         request.accepted_renderer.format,
+                         request.get_full_path()])
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        version = versions.get_version(self.cache_version_name)
+        key = self.get_cache_key(request, version)
+        etag = quote_etag(hashlib.md5(key.encode()).hexdigest())
+        last_modified = versions.last_modified(version)
+
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            data = cache.get(key)
+            if data is None:
+                response = handler(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(key, response.data,
+                          settings.REFERENCE_DATA_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, public=True,
+                            max_age=settings.REFERENCE_DATA_MAX_AGE)
+        return response
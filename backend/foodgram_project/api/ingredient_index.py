@@ -0,0 +1,129 @@
+'''
+In-process index of the ingredient dictionary for autocomplete.
+
+The dictionary is loaded by the set-ingredients command and almost never
+changes, so every worker keeps a copy of it in memory. Normalized names
+are joined into one string (one name per line) with an array of line
+offsets, which gives binary search for prefixes and a fast str.find()
+scan for mid-word matches. Results are built from a list of the
+original names, an array of ids and interned measurement units, so a
+search does not touch the database.
+
+The index remembers the version of the ingredient data it was built from
+(see recipes.versions) and is rebuilt on the first lookup after the
+version changes, including changes made by other processes such as the
+set-ingredients command.
+'''
+import bisect
+import sys
+import threading
+from array import array
+
+from recipes import versions
+from recipes.models import Ingredient
+
+SEPARATOR = '\n'
+
+
+def normalize(value):
+    return value.strip().casefold().replace('ё', 'е')
+
+
+class IngredientIndex:
+
+    def __init__(self, rows):
+        '''rows: iterable of (id, name, measurement_unit)'''
+        entries = sorted(
+            ((normalize(name), name, pk, measurement_unit)
+             for pk, name, measurement_unit in rows),
+            key=lambda entry: (entry[0], entry[1]))
+        self.keys = SEPARATOR.join(entry[0] for entry in entries)
+        self.offsets = array('q')
+        self.ids = array('q')
+        self.names = []
+        self.units = []
+        offset = 0
+        for key, name, pk, measurement_unit in entries:
+            self.offsets.append(offset)
+            offset += len(key) + len(SEPARATOR)
+            self.ids.append(pk)
+            self.names.append(name)
+            self.units.append(sys.intern(measurement_unit))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def key(self, position):
+        end = self.keys.find(SEPARATOR, self.offsets[position])
+        return self.keys[self.offsets[position]:end if end >= 0 else None]
+
+    def item(self, position):
+        return {'id': self.ids[position],
+                'name': self.names[position],
+                'measurement_unit': self.units[position]}
+
+    def prefix_range(self, term):
+        lower = bisect.bisect_left(range(len(self)), term, key=self.key)
+        upper = bisect.bisect_left(range(lower, len(self)),
+                                   term + '\U0010ffff', key=self.key)
+        return range(lower, lower + upper)
+
+    def contains(self, term):
+        '''Yield positions of names containing term not at the start.'''
+        start = self.keys.find(term)
+        while start >= 0:
+            position = bisect.bisect_right(self.offsets, start) - 1
+            if start != self.offsets[position]:
+                yield position
+            if position + 1 >= len(self):
+                return
+            start = self.keys.find(term, self.offsets[position + 1])
+
+    def search(self, term, limit):
+        '''
+        Result of api.search.search_ingredients, from memory. Unlike
+        the database, the index treats ё as е, folds the case of every
+        letter (SQLite's LOWER() folds only ASCII) and orders names by
+        their normalized form.
+        '''
+        term = normalize(term)
+        if not term:
+            return [self.item(position)
+                    for position in range(min(limit, len(self)))]
+        if SEPARATOR in term:
+            # would match across the end of one name and the next
+            return []
+        positions = list(self.prefix_range(term)[:limit])
+        if len(positions) < limit:
+            for position in self.contains(term):
+                positions.append(position)
+                if len(positions) >= limit:
+                    break
+        return [self.item(position) for position in positions]
+
+
+_lock = threading.Lock()
+_index = None
+_index_version = None
+
+
+def build_index():
+    return IngredientIndex(Ingredient.objects.values_list(
+        'id', 'name', 'measurement_unit').iterator())
+
+
+def get_index():
+    '''Return the index, rebuilding it if ingredients have changed.'''
+    global _index, _index_version
+    version = versions.get_version(versions.INGREDIENTS)
+    if _index is not None and _index_version == version:
+        return _index
+    with _lock:
+        if _index is None or _index_version != version:
+            _index = build_index()
+            _index_version = version
+    return _index
+
+
+def warm_up():
+    get_index()
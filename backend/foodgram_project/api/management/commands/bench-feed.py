@@ -0,0 +1,135 @@
+import random
+from datetime import timedelta
+from urllib.parse import parse_qs, urlsplit
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import override_settings
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from api.benchmark import format_summary, measure, rolled_back
+from api.querysets import recipes_for_read
+from api.serializers import RecipeReadSerializer
+from api.views import RecipeViewSet
+from foodgram_project.db import without_auto_now
+from recipes import feed
+from recipes.models import Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+FEED_URL = '/api/recipes/feed/'
+
+
+class Command(BaseCommand):
+    help = ('Measure the subscriptions feed read from the recipes table '
+            'and from materialized inboxes. Data is created in a '
+            'transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--authors', type=int, default=10000)
+        parser.add_argument('--recipes', type=int, default=100000)
+        parser.add_argument('--following', type=int, nargs='+',
+                            default=[50, 2000],
+                            help='numbers of authors followed by readers')
+        parser.add_argument('--depth', type=int, default=20,
+                            help='page to measure deep reads at')
+        parser.add_argument('--repeat', type=int, default=10)
+
+    def seed(self, options):
+        rnd = random.Random(0)
+        authors = User.objects.bulk_create(
+            (User(username=f'bench_feed_{index}',
+                  email=f'bench_feed_{index}@example.com',
+                  first_name='Bench', last_name='Bench', password='!')
+             for index in range(options['authors'])),
+            batch_size=1000)
+        # a few prolific authors and a long tail, like real sites
+        weights = [1 / rank for rank in range(1, len(authors) + 1)]
+        now = timezone.now()
+        with without_auto_now(Recipe, 'pub_date'):
+            Recipe.objects.bulk_create(
+                (Recipe(author=author, name='bench', text='bench',
+                        cooking_time=1,
+                        pub_date=now - timedelta(minutes=index))
+                 for index, author in enumerate(rnd.choices(
+                     authors, weights, k=options['recipes']))),
+                batch_size=2000)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        return rnd, authors
+
+    def make_reader(self, rnd, authors, following):
+        reader = User.objects.create_user(
+            username=f'bench_reader_{following}',
+            email=f'bench_reader_{following}@example.com',
+            first_name='Bench', last_name='Bench')
+        Follow.objects.bulk_create(
+            Follow(user=reader, author=author)
+            for author in rnd.sample(authors, following))
+        User.objects.filter(pk=reader.pk).update(following_count=following)
+        reader.refresh_from_db()
+        return reader
+
+    def request_feed(self, reader, cursor=None):
+        request = APIRequestFactory().get(
+            FEED_URL, {'cursor': cursor} if cursor else {},
+            HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        force_authenticate(request, reader)
+        response = RecipeViewSet.as_view(
+            {'get': 'feed'}, **RecipeViewSet.feed.kwargs)(request)
+        response.render()
+        return response
+
+    def cursor_at(self, reader, depth):
+        cursor = None
+        for _ in range(depth - 1):
+            next_url = self.request_feed(reader, cursor).data['next']
+            if next_url is None:
+                break
+            cursor = parse_qs(urlsplit(next_url).query)['cursor'][0]
+        return cursor
+
+    def bench_reader(self, reader, label, options):
+        repeat = options['repeat']
+        cursor = self.cursor_at(reader, options['depth'])
+        self.stdout.write(format_summary(
+            f'  {label}, first page',
+            measure(lambda: self.request_feed(reader), repeat)))
+        self.stdout.write(format_summary(
+            f'  {label}, page {options["depth"]}',
+            measure(lambda: self.request_feed(reader, cursor), repeat)))
+
+    def naive(self, reader, depth):
+        '''author__in with OFFSET paging and a COUNT, for comparison.'''
+        recipes = recipes_for_read(reader, Recipe.objects.filter(
+            author__in=reader.follow.all()))
+        offset = (depth - 1) * 9
+        recipes.count()
+        return RecipeReadSerializer(
+            recipes.order_by('-pub_date')[offset:offset + 9], many=True,
+            context={'request': None}).data
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            rnd, authors = self.seed(options)
+            self.stdout.write(f'{len(authors)} authors, '
+                              f'{options["recipes"]} recipes')
+            for following in options['following']:
+                reader = self.make_reader(rnd, authors, following)
+                self.stdout.write(f'reader following {following} authors')
+                self.stdout.write(format_summary(
+                    f'  naive, page {options["depth"]}',
+                    measure(lambda: self.naive(reader, options['depth']),
+                            options['repeat'])))
+                with override_settings(FEED_INBOX_THRESHOLD=None):
+                    self.bench_reader(reader, 'fan-out on read', options)
+                with override_settings(FEED_INBOX_THRESHOLD=0):
+                    self.stdout.write(format_summary(
+                        '  inbox build',
+                        measure(lambda: feed.rebuild(reader), 1)))
+                    self.bench_reader(reader, 'inbox', options)
@@ -0,0 +1,53 @@
+import base64
+import io
+import os
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from django.test import override_settings
+
+from api.benchmark import format_summary, measure
+from api.uploads import decode_data_uri
+
+
+def legacy_decode(data):
+    '''What Base64ImageField did before api.uploads.'''
+    _, imgstr = data.split(';base64,')
+    return io.BytesIO(base64.b64decode(imgstr))
+
+
+def streaming_decode(data):
+    with decode_data_uri(data) as file:
+        return file.tell()
+
+
+class Command(BaseCommand):
+    help = ('Measure memory and time of decoding a base64 data URI image '
+            'upload, the old in-memory way and the streaming one')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10,
+                            help='decoded image size in MiB')
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def peak(self, func, data):
+        tracemalloc.start()
+        func(data)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return peak
+
+    def handle(self, *args, **options):
+        size = options['size'] * 2 ** 20
+        data = ('data:image/jpeg;base64,'
+                + base64.b64encode(os.urandom(size)).decode())
+        self.stdout.write(f'{size / 2 ** 20:.0f} MiB image, '
+                          f'{len(data) / 2 ** 20:.1f} MiB data URI')
+        # the limit must not reject the benchmark image
+        with override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=size):
+            for label, func in (('in memory', legacy_decode),
+                                ('streaming', streaming_decode)):
+                peak = self.peak(func, data)
+                self.stdout.write(format_summary(
+                    f'  {label}, peak {peak / 2 ** 20:6.1f} MiB',
+                    measure(lambda: func(data), options['repeat'])))
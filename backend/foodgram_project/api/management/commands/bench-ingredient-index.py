@@ -0,0 +1,58 @@
+import csv
+import os
+import time
+import tracemalloc
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from api.benchmark import format_summary, measure
+from api.ingredient_index import IngredientIndex
+
+TERMS = ['м', 'мол', 'молоко', 'Ёж', 'сыр', 'ябл', 'соус', 'ово', 'xyz']
+
+
+class Command(BaseCommand):
+    help = ('Measure memory footprint and lookup latency of the in-process '
+            'ingredient index built from ingredients.csv scaled up')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(settings.BASE_DIR,
+                                 'static_backend/data/ingredients.csv'))
+        parser.add_argument('--scales', type=int, nargs='+',
+                            default=[1, 10, 100])
+        parser.add_argument('--repeat', type=int, default=200)
+        parser.add_argument('--limit', type=int,
+                            default=settings.INGREDIENT_SEARCH_LIMIT)
+
+    def rows(self, path, scale):
+        with open(path, encoding='utf-8') as csvfile:
+            base = list(csv.reader(csvfile))
+        pk = 0
+        for copy in range(scale):
+            for name, measurement_unit in base:
+                pk += 1
+                yield (pk, f'{name} {copy}' if copy else name,
+                       measurement_unit)
+
+    def handle(self, *args, **options):
+        for scale in options['scales']:
+            rows = list(self.rows(options['file'], scale))
+            tracemalloc.start()
+            started = time.perf_counter()
+            index = IngredientIndex(rows)
+            build_time = time.perf_counter() - started
+            size, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.stdout.write(
+                f'{len(index)} ingredients: built in '
+                f'{build_time * 1000:.1f} ms, '
+                f'{size / 2 ** 20:.2f} MiB retained, '
+                f'{peak / 2 ** 20:.2f} MiB peak')
+            for term in TERMS:
+                self.stdout.write(format_summary(
+                    f'  "{term}"',
+                    measure(lambda: index.search(term, options['limit']),
+                            options['repeat'])))
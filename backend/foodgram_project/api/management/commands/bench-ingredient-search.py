@@ -0,0 +1,56 @@
+import csv
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.benchmark import format_summary, measure, rolled_back
+from api.search import search_ingredients
+from recipes.models import Ingredient
+
+TERMS = ['м', 'мо', 'мол', 'молоко', 'сыр', 'ябл', 'соус', 'ово']
+
+
+class Command(BaseCommand):
+    help = ('Measure ingredient autocomplete over ingredients.csv scaled '
+            'up. Data is created in a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--file',
+            default=os.path.join(settings.BASE_DIR,
+                                 'static_backend/data/ingredients.csv'))
+        parser.add_argument('--scale', type=int, default=100)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--limit', type=int,
+                            default=settings.INGREDIENT_SEARCH_LIMIT)
+
+    def load(self, path, scale):
+        with open(path, encoding='utf-8') as csvfile:
+            rows = list(csv.reader(csvfile))
+        for copy in range(scale):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=f'{name} {copy}' if copy else name,
+                            measurement_unit=measurement_unit)
+                 for name, measurement_unit in rows),
+                batch_size=5000)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE recipes_ingredient')
+        return len(rows) * scale
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            total = self.load(options['file'], options['scale'])
+            self.stdout.write(f'{Ingredient.objects.count()} ingredients '
+                              f'({total} added)')
+            for term in TERMS:
+                self.stdout.write(format_summary(
+                    f'"{term}" istartswith, unlimited',
+                    measure(lambda: list(Ingredient.objects.filter(
+                        name__istartswith=term)), options['repeat'])))
+                self.stdout.write(format_summary(
+                    f'"{term}" search, limit {options["limit"]}',
+                    measure(lambda: search_ingredients(
+                        term, options['limit']), options['repeat'])))
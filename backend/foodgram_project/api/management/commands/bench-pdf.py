@@ -0,0 +1,79 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import RequestFactory
+
+from api.benchmark import format_summary, measure, rolled_back
+from api.utils import pdf_cache, pdf_maker, render_pdf, shopping_list_rows
+from recipes import shopping_list
+from recipes.models import Cart, Ingredient, IngredientRecipe, Recipe
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Measure shopping list PDF rendering for carts of different '
+            'sizes. Data is created in a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+',
+                            default=[10, 100, 1000],
+                            help='numbers of recipes in the cart')
+        parser.add_argument('--ingredients-per-recipe', type=int,
+                            default=10)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def make_cart(self, size, per_recipe):
+        user = User.objects.create_user(
+            username=f'bench_pdf_{size}',
+            email=f'bench_pdf_{size}@example.com',
+            first_name='Bench', last_name='Bench')
+        ingredients = Ingredient.objects.bulk_create(
+            Ingredient(name=f'bench ingredient {size} {index}',
+                       measurement_unit='г')
+            for index in range(size + per_recipe))
+        recipes = Recipe.objects.bulk_create(
+            Recipe(author=user, name=f'bench recipe {index}', text='bench',
+                   cooking_time=1)
+            for index in range(size))
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe,
+                             ingredient=ingredients[index + offset],
+                             amount=offset + 1)
+            for index, recipe in enumerate(recipes)
+            for offset in range(per_recipe))
+        Cart.objects.bulk_create(Cart(user=user, recipe=recipe)
+                                 for recipe in recipes)
+        shopping_list.rebuild([user.pk])
+        return user
+
+    def bench_size(self, size, options):
+        user = self.make_cart(size, options['ingredients_per_recipe'])
+        request = RequestFactory().get('/api/recipes/download_shopping_cart/')
+        request.user = user
+        rows = list(shopping_list_rows(user))
+        repeat = options['repeat']
+
+        self.stdout.write(f'cart of {size} recipes, {len(rows)} rows')
+        self.stdout.write(format_summary(
+            '  render', measure(lambda: render_pdf(rows), repeat)))
+
+        def cold():
+            pdf_cache.clear()
+            pdf_maker(request)
+        self.stdout.write(format_summary(
+            '  download, cache miss', measure(cold, repeat)))
+        self.stdout.write(format_summary(
+            '  download, cache hit',
+            measure(lambda: pdf_maker(request), repeat)))
+
+        etag = pdf_maker(request)['ETag']
+        request.META['HTTP_IF_NONE_MATCH'] = etag
+        self.stdout.write(format_summary(
+            '  download, not modified',
+            measure(lambda: pdf_maker(request), repeat)))
+
+    def handle(self, *args, **options):
+        with rolled_back():
+            for size in options['sizes']:
+                self.bench_size(size, options)
+        pdf_cache.clear()
@@ -0,0 +1,275 @@
+import base64
+import io
+import json
+import shutil
+import tempfile
+from datetime import datetime, timezone
+from itertools import combinations, cycle
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import override_settings
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.benchmark import compare, profile, rolled_back
+from api.seeding import seed_data
+from api.utils import SHOPPING_LIST_FORMATS
+from foodgram_project.pagination import RecipePagination
+from recipes import counters, shopping_list, trending, versions
+from recipes.models import Cart, Favorite, Ingredient, Recipe, Tag
+from users.models import Follow
+
+User = get_user_model()
+
+RECIPE_FILTERS = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+THRESHOLDS = ('max_slowdown', 'min_delta_ms', 'max_extra_queries',
+              'max_memory_growth')
+
+
+def image_data_uri(size=(64, 64)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'orange').save(buffer, format='PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+class Command(BaseCommand):
+    help = ('Measure latency, number of queries and peak memory of every '
+            'API endpoint, write a JSON report and compare it with a '
+            'baseline report. Data is created in a transaction and rolled '
+            'back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200,
+                            help='users generated by seed')
+        parser.add_argument('--recipes', type=int, default=2000,
+                            help='recipes generated by seed')
+        parser.add_argument('--existing', action='store_true',
+                            help='measure on the data in the database '
+                                 'instead of generating it')
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--only', nargs='+', metavar='TEXT',
+                            help='measure endpoints whose names contain '
+                                 'one of the texts')
+        parser.add_argument('--output', metavar='FILE',
+                            help='write the JSON report to FILE')
+        parser.add_argument('--baseline', metavar='FILE',
+                            help='fail on regressions against this report')
+        parser.add_argument('--max-slowdown', type=float, default=1.5,
+                            help='allowed ratio of the median time to the '
+                                 'baseline')
+        parser.add_argument('--min-delta-ms', type=float, default=2.0,
+                            help='differences of the median below this are '
+                                 'noise')
+        parser.add_argument('--max-extra-queries', type=int, default=0)
+        parser.add_argument('--max-memory-growth', type=float, default=1.5,
+                            help='allowed peak memory ratio to the baseline')
+
+    def seed(self, options):
+        if not Ingredient.objects.exists():
+            call_command('set-ingredients', stdout=io.StringIO())
+        seed_data({
+            'users': options['users'], 'recipes': options['recipes'],
+            'tags': 5, 'ingredients': 6, 'follows': 10, 'favorites': 20,
+            'cart': 3, 'zipf': 1.0, 'seed': 0, 'prefix': 'bench_api_',
+            'password': 'bench', 'batch_size': 1000, 'workers': 1,
+        }, lambda stage, done: None)
+        counters.recount()
+        shopping_list.rebuild()
+        trending.refresh(full=True)
+
+    def prepare(self, repeat):
+        '''
+        Reader with follows, favorites and a cart, and ids the endpoints
+        are called with.
+        '''
+        user = User.objects.create_user(
+            username='bench_api', email='bench_api@example.com',
+            first_name='Bench', last_name='Bench')
+        self.token = Token.objects.create(user=user)
+        calls = repeat + 1
+        recipe_ids = list(Recipe.objects.order_by(
+            '-pub_date', '-id').values_list('pk', flat=True)[:30 + calls])
+        author_ids = list(User.objects.exclude(pk=user.pk).filter(
+            recipes_count__gt=0).order_by('-recipes_count').values_list(
+            'pk', flat=True)[:10 + calls])
+        if len(recipe_ids) < 30 + calls or len(author_ids) < 10 + calls:
+            raise CommandError('Not enough recipes or authors, seed more '
+                               'data or lower --repeat')
+        Follow.objects.bulk_create(Follow(user=user, author_id=pk)
+                                   for pk in author_ids[:10])
+        User.objects.filter(pk=user.pk).update(following_count=10)
+        Favorite.objects.bulk_create(Favorite(user=user, recipe_id=pk)
+                                     for pk in recipe_ids[:20])
+        Cart.objects.bulk_create(Cart(user=user, recipe_id=pk)
+                                 for pk in recipe_ids[20:30])
+        shopping_list.rebuild([user.pk])
+        # responses cached before the benchmark must not be served
+        for name in (versions.TAGS, versions.INGREDIENTS,
+                     versions.TRENDING):
+            versions.bump_version(name)
+        return {
+            'recipe': recipe_ids[0],
+            'author': author_ids[0],
+            'tags': list(Tag.objects.values_list('slug', flat=True)[:2]),
+            'ingredients': list(Ingredient.objects.values_list(
+                'pk', flat=True)[:6]),
+            'targets': recipe_ids[30:],
+            'authors': author_ids[10:],
+        }
+
+    def call(self, method, url, status, data=None):
+        response = getattr(self.client, method)(url, data, format='json')
+        content = (b''.join(response.streaming_content)
+                   if response.streaming else response.content)
+        if response.status_code != status:
+            raise CommandError(f'{method.upper()} {url}: '
+                               f'{response.status_code} {content[:300]}')
+        return response
+
+    def get(self, url, params=None):
+        return lambda: self.call('get', url, 200, params)
+
+    def recipe_list_endpoints(self, data):
+        values = {'author': data['author'], 'tags': data['tags'],
+                  'is_favorited': 1, 'is_in_shopping_cart': 1}
+        for size in range(len(RECIPE_FILTERS) + 1):
+            for names in combinations(RECIPE_FILTERS, size):
+                query = '?' + '&'.join(names) if names else ''
+                yield (f'GET /api/recipes/{query}',
+                       self.get('/api/recipes/', {
+                           name: values[name] for name in names}))
+        yield ('GET /api/recipes/?tags&tags_mode=all',
+               self.get('/api/recipes/', {'tags': data['tags'],
+                                          'tags_mode': 'all'}))
+        yield ('GET /api/recipes/?ordering=-favorites_count',
+               self.get('/api/recipes/', {'ordering': '-favorites_count'}))
+        # page 20, or the last one of a small dataset
+        page = max(1, min(20, Recipe.objects.count()
+                          // RecipePagination.page_size))
+        yield ('GET /api/recipes/?page=deep',
+               self.get('/api/recipes/', {'page': page}))
+
+    def read_endpoints(self, data):
+        yield 'GET /api/tags/', self.get('/api/tags/')
+        yield 'GET /api/tags/{id}/', self.get(
+            f'/api/tags/{Tag.objects.values_list("pk", flat=True)[0]}/')
+        yield 'GET /api/ingredients/?name', self.get(
+            '/api/ingredients/', {'name': 'мо'})
+        yield 'GET /api/ingredients/{id}/', self.get(
+            f'/api/ingredients/{data["ingredients"][0]}/')
+        yield 'GET /api/recipes/{id}/', self.get(
+            f'/api/recipes/{data["recipe"]}/')
+        yield 'GET /api/recipes/feed/', self.get('/api/recipes/feed/')
+        yield 'GET /api/recipes/trending/', self.get(
+            '/api/recipes/trending/')
+        for export_format in SHOPPING_LIST_FORMATS:
+            yield (f'GET /api/recipes/download_shopping_cart/'
+                   f'?format={export_format}',
+                   self.get('/api/recipes/download_shopping_cart/',
+                            {'format': export_format}))
+        yield 'GET /api/users/', self.get('/api/users/')
+        yield 'GET /api/users/{id}/', self.get(
+            f'/api/users/{data["author"]}/')
+        yield 'GET /api/users/me/', self.get('/api/users/me/')
+        yield 'GET /api/users/subscriptions/', self.get(
+            '/api/users/subscriptions/', {'recipes_limit': 3})
+
+    def toggle_endpoints(self, url, ids, created):
+        added, removed = iter(ids), iter(ids)
+        yield f'POST {url}', lambda: self.call(
+            'post', url.format(id=next(added)), created)
+        yield f'DELETE {url}', lambda: self.call(
+            'delete', url.format(id=next(removed)), 204)
+
+    def write_endpoints(self, data):
+        created = []
+        payload = {
+            'name': 'Бенчмарк', 'text': 'Смешать и подать.',
+            'cooking_time': 10, 'image': image_data_uri(),
+            'tags': list(Tag.objects.values_list('pk', flat=True)[:2]),
+            'ingredients': [{'id': pk, 'amount': 100}
+                            for pk in data['ingredients']],
+        }
+        yield 'POST /api/recipes/', lambda: created.append(self.call(
+            'post', '/api/recipes/', 201, payload).data['id'])
+        # the frontend sends the whole recipe, alternate two versions
+        changes = cycle([
+            {**payload, 'name': 'Бенчмарк 2',
+             'ingredients': payload['ingredients'][1:],
+             'tags': payload['tags'][:1]},
+            payload,
+        ])
+        patched = cycle(created)
+        yield 'PATCH /api/recipes/{id}/', lambda: self.call(
+            'patch', f'/api/recipes/{next(patched)}/', 200, next(changes))
+        yield from self.toggle_endpoints(
+            '/api/recipes/{id}/favorite/', data['targets'], 201)
+        yield from self.toggle_endpoints(
+            '/api/recipes/{id}/shopping_cart/', data['targets'], 201)
+        yield from self.toggle_endpoints(
+            '/api/users/{id}/subscribe/', data['authors'], 200)
+
+    def measure(self, options):
+        if not options['existing']:
+            self.seed(options)
+        data = self.prepare(options['repeat'])
+        self.client = APIClient(HTTP_HOST=settings.ALLOWED_HOSTS[0])
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        results = {}
+        for endpoints in (self.read_endpoints, self.recipe_list_endpoints,
+                          self.write_endpoints):
+            for name, func in endpoints(data):
+                if options['only'] and not any(
+                        text in name for text in options['only']):
+                    continue
+                results[name] = profile(func, options['repeat'])
+                self.stdout.write(
+                    f'{name:<64} p50 {results[name]["p50"]:8.2f} ms  '
+                    f'p95 {results[name]["p95"]:8.2f} ms  '
+                    f'{results[name]["queries"]:3} queries  '
+                    f'{results[name]["peak_kib"]:8.0f} KiB')
+        return results
+
+    def handle(self, *args, **options):
+        media_root = tempfile.mkdtemp()
+        try:
+            with override_settings(MEDIA_ROOT=media_root,
+                                   RECIPE_IMAGE_WORKERS=0), rolled_back():
+                results = self.measure(options)
+        finally:
+            shutil.rmtree(media_root, ignore_errors=True)
+        report = {
+            'meta': {
+                'date': datetime.now(timezone.utc).isoformat(),
+                'database': connection.vendor,
+                'repeat': options['repeat'],
+                'existing': options['existing'],
+                'users': options['users'],
+                'recipes': options['recipes'],
+            },
+            'endpoints': results,
+        }
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
+        if options['baseline']:
+            self.check_baseline(results, options)
+
+    def check_baseline(self, results, options):
+        with open(options['baseline'], encoding='utf-8') as file:
+            baseline = json.load(file)['endpoints']
+        regressions = compare(results, baseline, **{
+            name: options[name] for name in THRESHOLDS})
+        for regression in regressions:
+            self.stderr.write(regression)
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions against '
+                               f'{options["baseline"]}')
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: no regressions against {options["baseline"]}'))
@@ -0,0 +1,138 @@
+import itertools
+import random
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.http import QueryDict
+from django.test import RequestFactory
+
+from api.benchmark import rolled_back
+from api.querysets import recipes_for_read
+from api.views import RecipeFilter
+from recipes.models import Cart, Favorite, Recipe, Tag
+
+User = get_user_model()
+
+# PostgreSQL: "Seq Scan on recipes_recipe"
+# SQLite: "SCAN recipes_recipe", but not "SCAN ... USING INDEX ..."
+SEQUENTIAL_SCAN = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?!\w| USING (?:COVERING )?INDEX)'),
+}
+PAGE_SIZE = 9
+
+
+class Command(BaseCommand):
+    help = ('Explain the recipe list query for every RecipeFilter '
+            'combination on a seeded dataset and flag sequential scans. '
+            'The dataset is created in a transaction and rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=5000,
+                            help='number of recipes to seed')
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--no-seed', action='store_true',
+                            help='explain against existing data')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='print every plan, not only flagged ones')
+        parser.add_argument('--fail-on-seqscan', action='store_true',
+                            help='exit with an error if any query plan '
+                                 'contains a sequential scan')
+
+    def seed(self, recipes_count, users_count):
+        rnd = random.Random(0)
+        users = User.objects.bulk_create(
+            User(username=f'explain_{index}',
+                 email=f'explain_{index}@example.com',
+                 first_name='Explain', last_name='Explain',
+                 password='!')
+            for index in range(users_count))
+        tags = Tag.objects.bulk_create(
+            Tag(name=f'explain {index}', color='#000000',
+                slug=f'explain_{index}')
+            for index in range(8))
+        recipes = Recipe.objects.bulk_create(
+            (Recipe(author=rnd.choice(users), name=f'explain {index}',
+                    text='explain', cooking_time=1)
+             for index in range(recipes_count)),
+            batch_size=1000)
+        Recipe.tags.through.objects.bulk_create(
+            (Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+             for recipe in recipes for tag in rnd.sample(tags, 2)),
+            batch_size=1000)
+        user = users[0]
+        for model in (Favorite, Cart):
+            model.objects.bulk_create(
+                model(user=user, recipe=recipe)
+                for recipe in rnd.sample(recipes, len(recipes) // 20))
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        return user
+
+    def combinations(self):
+        author = Recipe.objects.values_list('author_id', flat=True).first()
+        slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+        filters = {
+            'author': [('author', str(author))],
+            'tags': [('tags', slug) for slug in slugs],
+            'is_favorited': [('is_favorited', '1')],
+            'is_in_shopping_cart': [('is_in_shopping_cart', '1')],
+        }
+        for size in range(len(filters) + 1):
+            for names in itertools.combinations(filters, size):
+                query = QueryDict(mutable=True)
+                for name in names:
+                    for key, value in filters[name]:
+                        query.appendlist(key, value)
+                yield query
+                if 'tags' in names:
+                    # one Exists() subquery per slug instead of one for all
+                    query = query.copy()
+                    query['tags_mode'] = 'all'
+                    yield query
+
+    def explain(self, queryset):
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                # with sequential scans discouraged, a remaining one
+                # means there is no usable index
+                cursor.execute('SET LOCAL enable_seqscan = off')
+            return queryset.explain(analyze=True)
+        return queryset.explain()
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor,
+                                      SEQUENTIAL_SCAN['postgresql'])
+        flagged = 0
+        with rolled_back():
+            if options['no_seed']:
+                user = User.objects.filter(
+                    favorite_recipe__isnull=False).first()
+                if user is None:
+                    raise CommandError('no user with favorites to explain '
+                                       'filters for, run without --no-seed')
+            else:
+                user = self.seed(options['recipes'], options['users'])
+            request = RequestFactory().get('/api/recipes/')
+            request.user = user
+            for query in self.combinations():
+                queryset = RecipeFilter(
+                    query, queryset=recipes_for_read(user),
+                    request=request).qs[:PAGE_SIZE]
+                plan = self.explain(queryset)
+                scans = pattern.findall(plan)
+                label = query.urlencode() or '(no filters)'
+                if scans:
+                    flagged += 1
+                    self.stdout.write(self.style.WARNING(
+                        f'{label}: sequential scan on {", ".join(scans)}'))
+                else:
+                    self.stdout.write(self.style.SUCCESS(f'{label}: ok'))
+                if scans or options['verbose_plans']:
+                    self.stdout.write(plan)
+        if flagged and options['fail_on_seqscan']:
+            raise CommandError(f'{flagged} filter combinations use '
+                               'sequential scans')
@@ -0,0 +1,76 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from api.seeding import seed_data
+from recipes import counters, shopping_list, trending, versions
+from recipes.models import Ingredient
+from users.models import ProfileUser
+
+
+class Command(BaseCommand):
+    help = ('Fill the database with generated users, tags, recipes, '
+            'follows, favorites and cart entries for load testing. The '
+            'same --seed and sizes give the same data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument('--tags', type=int, default=10)
+        parser.add_argument('--ingredients', type=int, default=6,
+                            help='mean number of ingredients per recipe')
+        parser.add_argument('--follows', type=int, default=10,
+                            help='mean number of authors a user follows')
+        parser.add_argument('--favorites', type=int, default=20,
+                            help='mean number of favorites per user')
+        parser.add_argument('--cart', type=int, default=3,
+                            help='mean number of recipes in a cart')
+        parser.add_argument('--zipf', type=float, default=1.0,
+                            help='exponent of the popularity distribution')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='seed',
+                            help='prefix of generated usernames')
+        parser.add_argument('--password', default='seed-password',
+                            help='password of every generated user')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='processes writing recipes and relations, '
+                                 'PostgreSQL only')
+
+    def progress(self, stage, done):
+        if self.verbosity >= 2:
+            self.stdout.write(f'{stage}: {done}')
+
+    def finish(self):
+        '''Derived data the API would have maintained row by row.'''
+        counters.recount()
+        shopping_list.rebuild()
+        call_command('rebuild-feed-inboxes', stdout=self.stdout)
+        trending.refresh(full=True)
+        # tags are added with bulk_create(), which sends no signals
+        versions.bump_version(versions.TAGS)
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if ProfileUser.objects.filter(
+                username__startswith=options['prefix']).exists():
+            raise CommandError(f'Users named {options["prefix"]}... exist, '
+                               'choose another --prefix')
+        if options['workers'] > 1 and connection.vendor == 'sqlite':
+            self.stdout.write('SQLite has a single writer, using 1 worker')
+            options['workers'] = 1
+        if not Ingredient.objects.exists():
+            call_command('set-ingredients', stdout=self.stdout)
+        started = time.monotonic()
+        seed_data(options, self.progress)
+        seeded = time.monotonic()
+        self.finish()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: {options["users"]} users and {options["recipes"]} '
+            f'recipes created in {seeded - started:.1f} s, derived data '
+            f'rebuilt in {time.monotonic() - seeded:.1f} s'))
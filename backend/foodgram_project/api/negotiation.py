@@ -0,0 +1,14 @@
+from rest_framework.negotiation import BaseContentNegotiation
+
+
+class IgnoreFormatParamNegotiation(BaseContentNegotiation):
+    '''
+    Content negotiation for views which interpret ?format= themselves
+    instead of DRF choosing a renderer by it.
+    '''
+
+    def select_parser(self, request, parsers):
+        return parsers[0]
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return (renderers[0], renderers[0].media_type)
@@ -0,0 +1,29 @@
+import json
+
+from django.utils.datastructures import MultiValueDict
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class MultiPartJSONParser(MultiPartParser):
+    '''
+    Multipart form in which some fields hold JSON, e.g. a recipe with
+    image sent as a file and ingredients='[{"id": 1, "amount": 10}]',
+    tags='[1, 2]'. Other fields are plain strings. Files are returned
+    among the data, so serializers get one plain dict.
+    '''
+
+    json_fields = ('ingredients', 'tags')
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        result = super().parse(stream, media_type, parser_context)
+        data = result.data.dict()
+        for field in self.json_fields:
+            if field not in data:
+                continue
+            try:
+                data[field] = json.loads(data[field])
+            except ValueError:
+                raise ParseError(f'Поле {field} должно содержать JSON')
+        data.update(result.files.dict())
+        return DataAndFiles(data, MultiValueDict())
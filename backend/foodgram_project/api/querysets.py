@@ -0,0 +1,51 @@
+from django.db.models import (Exists, OuterRef, Prefetch,
+                              Subquery, Value)
+
+from recipes.models import (Tag, Recipe, IngredientRecipe,
+                            Favorite, Cart)
+from users.models import Follow
+
+
+def recipes_for_read(user, queryset=None):
+    '''
+    Recipe queryset with everything RecipeReadSerializer needs:
+    author, tags and ingredients are loaded in a fixed number of queries
+    and per-user flags are annotated as Exists() subqueries.
+    '''
+    if queryset is None:
+        queryset = Recipe.objects.all()
+    queryset = queryset.select_related('author').prefetch_related(
+        Prefetch('tags', queryset=Tag.objects.all()),
+        Prefetch('ingredient_recipe',
+                 queryset=IngredientRecipe.objects.select_related(
+                     'ingredient'))
+    )
+    if user.is_anonymous:
+        return queryset
+    return queryset.annotate(
+        annotated_is_favorited=Exists(Favorite.objects.filter(
+            user=user, recipe__pk=OuterRef('pk'))),
+        annotated_is_in_shopping_cart=Exists(Cart.objects.filter(
+            user=user, recipe__pk=OuterRef('pk'))),
+        annotated_author_is_subscribed=Exists(Follow.objects.filter(
+            user=user, author=OuterRef('author')))
+    )
+
+
+def subscriptions_for_read(user, recipes_limit=None):
+    '''
+    Authors followed by user prepared for UserSubscribeSerializer.
+
+    Recipe previews are fetched in one query for the whole page; with
+    recipes_limit only the newest recipes_limit recipes of every author
+    are selected by a correlated LIMIT subquery.
+    '''
+    recipes = Recipe.objects.order_by('-pub_date', '-id')
+    if recipes_limit is not None:
+        recipes = recipes.filter(pk__in=Subquery(
+            Recipe.objects.filter(author=OuterRef('author')).order_by(
+                '-pub_date', '-id').values('pk')[:recipes_limit]))
+    return user.follow.annotate(
+        annotated_is_subscribed=Value(True)
+    ).prefetch_related(
+        Prefetch('recipes', queryset=recipes, to_attr='recipes_preview'))
@@ -0,0 +1,122 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from recipes.models import Cart, Favorite, Recipe
+from users.models import Follow
+
+User = get_user_model()
+
+
+class RelationSet:
+    '''
+    Ids related to a user, e.g. ids of recipes in the user's favorites.
+
+    Membership tests load all ids with one query on first use. When
+    there are more than RELATION_SET_LIMIT of them, ids are instead
+    looked up with IN queries for the ids in scope: the objects of the
+    page being serialized, see expect().
+    '''
+
+    def __init__(self, queryset, field, size=None):
+        self.queryset = queryset
+        self.field = field
+        # known number of ids, if any, saves loading a set that is too big
+        self.size = size
+        self.ids = None
+        self.large = False
+        self.known = {}
+        self.scope = set()
+
+    def load(self):
+        limit = settings.RELATION_SET_LIMIT
+        if self.size is not None and self.size > limit:
+            self.large = True
+            return
+        ids = frozenset(self.queryset.values_list(
+            self.field, flat=True)[:limit + 1])
+        if len(ids) > limit:
+            self.large = True
+        else:
+            self.ids = ids
+
+    def expect(self, ids):
+        '''Ids that are going to be tested, looked up together.'''
+        self.scope.update(ids)
+
+    def __contains__(self, pk):
+        if self.ids is None and not self.large:
+            self.load()
+        if self.ids is not None:
+            return pk in self.ids
+        if pk not in self.known:
+            lookup = self.scope.difference(self.known) | {pk}
+            found = set(self.queryset.filter(
+                **{f'{self.field}__in': lookup}).values_list(
+                self.field, flat=True))
+            self.known.update((pk, pk in found) for pk in lookup)
+        return self.known[pk]
+
+
+class UserRelations:
+    '''
+    Authors followed by a user and recipes in the user's favorites and
+    cart. Serializers consult it for objects whose querysets were not
+    annotated, instead of querying per object.
+    '''
+
+    def __init__(self, user):
+        if user.is_anonymous:
+            self.following = RelationSet(Follow.objects.none(), 'author_id')
+            self.favorites = RelationSet(Favorite.objects.none(),
+                                         'recipe_id')
+            self.cart = RelationSet(Cart.objects.none(), 'recipe_id')
+            return
+        self.following = RelationSet(Follow.objects.filter(user=user),
+                                     'author_id', user.following_count)
+        self.favorites = RelationSet(Favorite.objects.filter(user=user),
+                                     'recipe_id')
+        self.cart = RelationSet(Cart.objects.filter(user=user), 'recipe_id')
+
+    def expect(self, objects):
+        '''Register recipes or users of a page, see RelationSet.'''
+        for obj in objects:
+            if isinstance(obj, Recipe):
+                self.favorites.expect([obj.pk])
+                self.cart.expect([obj.pk])
+                self.following.expect([obj.author_id])
+            elif isinstance(obj, User):
+                self.following.expect([obj.pk])
+
+
+def user_relations(request):
+    '''UserRelations of request.user, shared by the whole request.'''
+    relations = getattr(request, '_user_relations', None)
+    if relations is None:
+        relations = request._user_relations = UserRelations(request.user)
+    return relations
+
+
+def context_relations(context):
+    '''UserRelations put into a serializer context by RelationsMixin.'''
+    relations = context.get('relations')
+    if relations is None:
+        relations = user_relations(context['request'])
+    return relations
+
+
+class RelationsMixin:
+    '''
+    Viewset mixin putting UserRelations into the serializer context and
+    registering every page with it.
+    '''
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['relations'] = user_relations(self.request)
+        return context
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            user_relations(self.request).expect(page)
+        return page
@@ -0,0 +1,49 @@
+from django.conf import settings
+from django.db.models.functions import Lower
+from rest_framework import exceptions
+
+from recipes.models import Ingredient
+
+# "search" is what DRF SearchFilter used to accept
+SEARCH_PARAMS = ('name', 'search')
+
+
+def get_search_params(request):
+    '''Return (term, limit) of an ingredient search request.'''
+    term = ''
+    for param in SEARCH_PARAMS:
+        if param in request.query_params:
+            term = request.query_params[param].strip()
+            break
+    limit = request.query_params.get('limit',
+                                     settings.INGREDIENT_SEARCH_LIMIT)
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        limit = 0
+    if limit < 1:
+        raise exceptions.ValidationError({
+            'limit': ['Ожидается положительное целое число']})
+    return term, min(limit, settings.INGREDIENT_SEARCH_MAX_LIMIT)
+
+
+def search_ingredients(term, limit, queryset=None):
+    '''
+    Ingredients whose name contains term, names starting with term first.
+
+    Prefix matches are looked up by LOWER(name) LIKE 'term%', which is
+    served by the lower(name) text_pattern_ops index on PostgreSQL. Only
+    when they do not fill the limit, names containing term mid-word are
+    added; that query is served by the trigram index.
+    '''
+    if queryset is None:
+        queryset = Ingredient.objects.all()
+    queryset = queryset.annotate(lower_name=Lower('name')).order_by('name')
+    if not term:
+        return list(queryset[:limit])
+    term = term.lower()
+    found = list(queryset.filter(lower_name__startswith=term)[:limit])
+    if len(found) < limit:
+        found.extend(queryset.filter(lower_name__contains=term).exclude(
+            lower_name__startswith=term)[:limit - len(found)])
+    return found
@@ -0,0 +1,235 @@
+'''
+Synthetic data for load tests, see the seed command.
+
+Everything is drawn from random generators seeded with --seed and the
+number of the batch, so the same options give the same dataset however
+many worker processes build it; only dates are relative to the time of
+the run, and primary keys depend on the order in which batches are
+written. Relations therefore refer to recipes by their position (batch,
+index in the batch) rather than by primary key.
+
+Popularity follows Zipf's law: the author of rank r gets recipes and
+followers in proportion to 1 / r ** exponent, and so do recipes in
+favorites and carts.
+
+Rows are written in batches, recipes and users with bulk_create() and
+the much more numerous relation rows as plain tuples, without the per-row
+hooks of the API, so counters, shopping lists, feed inboxes and trending
+scores are recomputed once at the end.
+'''
+import multiprocessing
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connections, transaction
+from django.utils import timezone
+
+from foodgram_project.db import insert_many, without_auto_now
+from recipes.models import (Cart, Favorite, Ingredient, IngredientRecipe,
+                            Recipe, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+TAG_COLORS = ('#E26C2D', '#49B64E', '#8775D2', '#F2C94C', '#2F80ED')
+RECIPES_PERIOD = timedelta(days=365)
+ADDED_PERIOD = timedelta(days=30)
+
+# data shared with worker processes, see run()
+context = {}
+
+
+def zipf_index(rnd, count, exponent):
+    '''
+    Random index in range(count), index i drawn with probability about
+    proportional to 1 / (i + 1) ** exponent.
+    '''
+    # inverse of the continuous power law distribution on [1, count]
+    share = rnd.random()
+    if exponent == 1:
+        rank = count ** share
+    else:
+        power = 1 - exponent
+        rank = ((count ** power - 1) * share + 1) ** (1 / power)
+    return min(int(rank), count) - 1
+
+
+def around(rnd, mean):
+    '''Random count between 0 and 2 * mean with the given mean.'''
+    return rnd.randint(0, 2 * mean)
+
+
+def batch_random(name, number):
+    return random.Random(f'{context["seed"]}:{name}:{number}')
+
+
+def create_users(prefix, count, password, batch_size):
+    '''Create users, return their ids, the most popular author first.'''
+    password = make_password(password)
+    ids = []
+    for start in range(0, count, batch_size):
+        users = User.objects.bulk_create(
+            User(username=f'{prefix}{index}',
+                 email=f'{prefix}{index}@example.com',
+                 first_name='Повар', last_name=f'№{index}',
+                 password=password)
+            for index in range(start, min(start + batch_size, count)))
+        ids.extend(user.pk for user in users)
+    return ids
+
+
+def create_tags(count):
+    Tag.objects.bulk_create(
+        (Tag(name=f'Тег {index}', slug=f'seed-{index}',
+             color=TAG_COLORS[index % len(TAG_COLORS)])
+         for index in range(count)),
+        ignore_conflicts=True)
+    return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+
+@transaction.atomic
+def create_recipes(task):
+    '''
+    Create one batch of recipes with their tags and ingredients, return
+    their ids in the order of the batch.
+    '''
+    number, count = task
+    rnd = batch_random('recipes', number)
+    author_ids = context['author_ids']
+    now = context['now']
+    exponent = context['exponent']
+    recipes = [
+        Recipe(author_id=author_ids[zipf_index(rnd, len(author_ids),
+                                               exponent)],
+               name=f'Рецепт {number}-{index}',
+               text='Смешать, приготовить и подать.',
+               cooking_time=rnd.randint(5, 180),
+               pub_date=now - RECIPES_PERIOD * rnd.random())
+        for index in range(count)]
+    with without_auto_now(Recipe, 'pub_date'):
+        Recipe.objects.bulk_create(recipes)
+    tags = []
+    ingredients = []
+    for recipe in recipes:
+        tags.extend(
+            (recipe.pk, tag_id)
+            for tag_id in rnd.sample(context['tag_ids'], rnd.randint(
+                1, min(3, len(context['tag_ids'])))))
+        ingredients.extend(
+            (recipe.pk, pk, rnd.randint(1, 500))
+            for pk in rnd.sample(context['ingredient_ids'], min(
+                max(1, around(rnd, context['ingredients'])),
+                len(context['ingredient_ids']))))
+    insert_many(Recipe.tags.through, ('recipe', 'tag'), tags)
+    insert_many(IngredientRecipe, ('recipe', 'ingredient', 'amount'),
+                ingredients)
+    return [recipe.pk for recipe in recipes]
+
+
+def pick(rnd, ids, mean, exclude=None):
+    '''Distinct popular ids, about mean of them.'''
+    if not ids:
+        return set()
+    picked = {ids[zipf_index(rnd, len(ids), context['exponent'])]
+              for _ in range(around(rnd, mean))}
+    picked.discard(exclude)
+    return picked
+
+
+def added_at(rnd):
+    return context['now'] - ADDED_PERIOD * rnd.random()
+
+
+@transaction.atomic
+def create_relations(task):
+    '''Follows, favorites and cart entries of one batch of users.'''
+    number, user_ids = task
+    rnd = batch_random('relations', number)
+    follows, favorites, cart = [], [], []
+    for user_id in user_ids:
+        follows.extend(
+            (user_id, author_id)
+            for author_id in pick(rnd, context['author_ids'],
+                                  context['follows'], exclude=user_id))
+        favorites.extend(
+            (user_id, pk, added_at(rnd))
+            for pk in pick(rnd, context['recipe_ids'],
+                           context['favorites']))
+        cart.extend(
+            (user_id, pk, added_at(rnd))
+            for pk in pick(rnd, context['recipe_ids'], context['cart']))
+    # generated users are new, so none of the rows can exist already
+    insert_many(Follow, ('user', 'author'), follows)
+    insert_many(Favorite, ('user', 'recipe', 'added_at'), favorites)
+    insert_many(Cart, ('user', 'recipe', 'added_at'), cart)
+    return len(follows) + len(favorites) + len(cart)
+
+
+def init_worker(data):
+    context.update(data)
+
+
+def run(func, tasks, workers):
+    '''Yield func(task) for every task, in worker processes if asked.'''
+    if workers <= 1:
+        yield from map(func, tasks)
+        return
+    # forked processes must not share the parent's connections
+    connections.close_all()
+    with ProcessPoolExecutor(
+            workers, mp_context=multiprocessing.get_context('fork'),
+            initializer=init_worker, initargs=(context,)) as pool:
+        yield from pool.map(func, tasks)
+
+
+def recipe_tasks(count, batch_size):
+    for number, start in enumerate(range(0, count, batch_size)):
+        yield number, min(batch_size, count - start)
+
+
+def relation_tasks(user_ids, batch_size):
+    for number, start in enumerate(range(0, len(user_ids), batch_size)):
+        yield number, user_ids[start:start + batch_size]
+
+
+def seed_data(options, progress):
+    '''
+    Create users, tags, recipes and relations described by options (see
+    the seed command); progress(stage, done) is called after each batch.
+    '''
+    context.clear()
+    context.update(
+        seed=options['seed'], exponent=options['zipf'],
+        ingredients=options['ingredients'], follows=options['follows'],
+        favorites=options['favorites'], cart=options['cart'],
+        now=timezone.now())
+    batch_size = options['batch_size']
+    user_ids = create_users(options['prefix'], options['users'],
+                            options['password'], batch_size)
+    progress('users', len(user_ids))
+    # authors are ranked in a seeded order rather than by id
+    context['author_ids'] = list(user_ids)
+    random.Random(f'{options["seed"]}:authors').shuffle(
+        context['author_ids'])
+    context['tag_ids'] = create_tags(options['tags'])
+    context['ingredient_ids'] = list(Ingredient.objects.order_by(
+        'pk').values_list('pk', flat=True))
+    # results come in the order of batches whichever worker wrote them
+    context['recipe_ids'] = []
+    for ids in run(create_recipes,
+                   recipe_tasks(options['recipes'], batch_size),
+                   options['workers']):
+        context['recipe_ids'].extend(ids)
+        progress('recipes', len(context['recipe_ids']))
+    random.Random(f'{options["seed"]}:recipes').shuffle(
+        context['recipe_ids'])
+    done = 0
+    # fewer users per batch, each brings several rows of every kind
+    for count in run(create_relations,
+                     relation_tasks(user_ids, max(1, batch_size // 20)),
+                     options['workers']):
+        done += count
+        progress('relations', done)
@@ -1,13 +1,17 @@
-import base64
-
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
 from django.contrib.auth import get_user_model
-from django.shortcuts import get_object_or_404
+from django.http import Http404
 from rest_framework import serializers
+from recipes import counters, feed, images, shopping_list
 from recipes.models import (Tag, Ingredient, Recipe,
-                            IngredientRecipe, Favorite, Cart)
+                            IngredientRecipe)
 from users.serializers import UserManageSerializer
 
+from . import uploads
+from .relations import context_relations
+
 User = get_user_model()
 
 
@@ -49,6 +53,65 @@ class IngredientRecipeSerializer(serializers.ModelSerializer):
                   "amount"]
 
 
+class Base64ImageField(serializers.ImageField):
+    '''
+    Image upload as a data URI or, in multipart requests, as a file.
+    Data URIs are decoded incrementally by api.uploads. The image is
+    validated and normalized by recipes.images and returned as a file
+    named by its content hash; it is written to the storage by
+    RecipeWriteSerializer.
+    '''
+
+    def to_internal_value(self, data):
+        try:
+            if isinstance(data, str):
+                file = uploads.decode_data_uri(data)
+            else:
+                uploads.check_size(getattr(data, 'size', 0))
+                file = super().to_internal_value(data)
+            with file:
+                name, content = images.normalize(file)
+        except (uploads.UploadError, images.ImageValidationError) as error:
+            raise serializers.ValidationError(str(error))
+        return ContentFile(content, name=name)
+
+
+class RecipeImageField(serializers.ImageField):
+    '''
+    URL of a WebP rendition of the recipe image: the given one, or
+    "full" for a single recipe and "card" for lists. The original is
+    served until renditions are generated.
+    '''
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_rendition(self):
+        if self.rendition is not None:
+            return self.rendition
+        view = self.context.get('view')
+        if getattr(view, 'action', None) == 'retrieve':
+            return 'full'
+        return 'card'
+
+    def to_representation(self, value):
+        if not value:
+            return None
+        rendition = value.instance.renditions.get(self.get_rendition())
+        if rendition is None:
+            return super().to_representation(value)
+        return media_url(self.context.get('request'), rendition['webp'])
+
+
+def media_url(request, name):
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     tags = TagSerializer(many=True, required=True)
     author = UserManageSerializer(read_only=True)
@@ -57,6 +120,8 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image = RecipeImageField()
+    image_renditions = serializers.SerializerMethodField()
 
     class Meta:
         model = Recipe
@@ -68,30 +133,37 @@ class RecipeReadSerializer(serializers.ModelSerializer):
                   "is_in_shopping_cart",
                   "name",
                   "image",
+                  "image_renditions",
                   "text",
                   "cooking_time"]
         depth = 1
 
+    def to_representation(self, instance):
+        if hasattr(instance, 'annotated_author_is_subscribed'):
+            instance.author.annotated_is_subscribed = (
+                instance.annotated_author_is_subscribed)
+        return super().to_representation(instance)
+
+    def get_image_renditions(self, obj):
+        '''Every rendition with its size and WebP and JPEG URLs.'''
+        request = self.context.get('request')
+        return {
+            rendition: {
+                key: (media_url(request, value)
+                      if key in images.FORMATS else value)
+                for key, value in files.items()}
+            for rendition, files in obj.renditions.items()
+            if rendition != 'source'}
+
     def get_is_favorited(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Favorite.objects.filter(user=user, recipe=obj).exists()
+        if hasattr(obj, 'annotated_is_favorited'):
+            return obj.annotated_is_favorited
+        return obj.id in context_relations(self.context).favorites
 
     def get_is_in_shopping_cart(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Cart.objects.filter(user=user, recipe=obj).exists()
-
-
-class Base64ImageField(serializers.ImageField):
-    def to_internal_value(self, data):
-        if isinstance(data, str) and data.startswith('data:image'):
-            format, imgstr = data.split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
-        return super().to_internal_value(data)
+        if hasattr(obj, 'annotated_is_in_shopping_cart'):
+            return obj.annotated_is_in_shopping_cart
+        return obj.id in context_relations(self.context).cart
 
 
 class RecipeWriteSerializer(serializers.ModelSerializer):
@@ -136,23 +208,19 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError(
                 'Нужен минимум один ингредиент для рецепта')
 
-        ingredient_list = []
-        ingredient_id_list = []
-        for ingredient_item in data:
-            ingredient = get_object_or_404(
-                Ingredient,
-                id=ingredient_item['ingredient']['id']
-            )
-            if ingredient.id in ingredient_id_list:
-                raise serializers.ValidationError(
-                    'Названия ингредиентов должны быть уникальными'
-                )
-            ingredient_list.append({
-                'ingredient': ingredient,
-                'amount': ingredient_item['amount']}
+        ingredient_ids = [ingredient_item['ingredient']['id']
+                          for ingredient_item in data]
+        if len(set(ingredient_ids)) < len(ingredient_ids):
+            raise serializers.ValidationError(
+                'Названия ингредиентов должны быть уникальными'
             )
-            ingredient_id_list.append(ingredient.id)
-        return ingredient_list
+        ingredients = Ingredient.objects.in_bulk(ingredient_ids)
+        if len(ingredients) < len(ingredient_ids):
+            raise Http404('Ингредиент не найден')
+        return [{'ingredient': ingredients[ingredient_id],
+                 'amount': ingredient_item['amount']}
+                for ingredient_id, ingredient_item in zip(ingredient_ids,
+                                                          data)]
 
     def create_ingredients(self, ingredients, recipe):
         obj = [
@@ -166,25 +234,70 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
         IngredientRecipe.objects.bulk_create(obj)
 
+    def store_image(self, validated_data):
+        # a stored name is assigned as is, the same image is kept once
+        if 'image' in validated_data:
+            validated_data['image'] = images.store(validated_data['image'])
+
+    def update_ingredients(self, ingredients, recipe):
+        '''
+        Bring ingredients of recipe in line with the validated list,
+        touching only rows which were added, changed or removed.
+        Return old and new {ingredient_id: amount}.
+        '''
+        rows = {row.ingredient_id: row
+                for row in recipe.ingredient_recipe.all()}
+        old_amounts = {ingredient_id: row.amount
+                       for ingredient_id, row in rows.items()}
+        new_amounts = {ingredient['ingredient'].id: ingredient['amount']
+                       for ingredient in ingredients}
+        changed = []
+        for ingredient_id, amount in new_amounts.items():
+            row = rows.get(ingredient_id)
+            if row is not None and row.amount != amount:
+                row.amount = amount
+                changed.append(row)
+        removed = old_amounts.keys() - new_amounts.keys()
+        if removed:
+            IngredientRecipe.objects.filter(
+                recipe=recipe, ingredient_id__in=removed).delete()
+        if changed:
+            IngredientRecipe.objects.bulk_update(changed, ['amount'])
+        self.create_ingredients(
+            [ingredient for ingredient in ingredients
+             if ingredient['ingredient'].id not in rows], recipe)
+        return old_amounts, new_amounts
+
+    @transaction.atomic
     def create(self, validated_data):
+        self.store_image(validated_data)
         ingredients_data = validated_data.pop('ingredient_recipe')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
+        counters.recipes_changed(recipe.author_id, 1)
+        feed.recipe_published(recipe)
         recipe.tags.set(tags)
         self.create_ingredients(ingredients_data, recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
+        self.store_image(validated_data)
         ingredients = validated_data.pop('ingredient_recipe')
         tags = validated_data.pop('tags')
-        instance.ingredients.clear()
-        self.create_ingredients(ingredients, instance)
-        instance.tags.clear()
+        old_amounts, new_amounts = self.update_ingredients(ingredients,
+                                                           instance)
+        if old_amounts != new_amounts:
+            shopping_list.change_recipe(instance.id, old_amounts,
+                                        new_amounts)
+        # set() only adds and removes the difference
         instance.tags.set(tags)
         return super().update(instance, validated_data)
 
 
 class RecipeMinifiedSerializer(serializers.ModelSerializer):
+    image = RecipeImageField(rendition='thumbnail')
+
     class Meta:
         model = Recipe
         fields = ["id",
@@ -194,8 +307,8 @@ class RecipeMinifiedSerializer(serializers.ModelSerializer):
 
 
 class UserSubscribeSerializer(UserManageSerializer):
-    recipes = RecipeMinifiedSerializer(many=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta:
         model = User
@@ -204,9 +317,9 @@ class UserSubscribeSerializer(UserManageSerializer):
                   'is_subscribed', 'recipes',
                   'recipes_count']
 
-    def get_recipes_count(self, obj):
-        if hasattr(obj, 'recipes'):
-            return len(obj.recipes.all())
-        raise TypeError('Serializer excpected object of'
-                        ' type User with attribute "recipes", '
-                        f'but got {type(obj)} without attribute "recipes"')
+    def get_recipes(self, obj):
+        recipes = getattr(obj, 'recipes_preview', None)
+        if recipes is None:
+            recipes = obj.recipes.all()
+        return RecipeMinifiedSerializer(
+            recipes, many=True, context=self.context).data
@@ -1,3 +1,1417 @@
+import base64
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipIf
 
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.core.files.storage import default_storage
+from django.db import connection
+from django.test import (SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APITestCase
 
-# Create your tests here.
+from recipes.models import (Tag, Ingredient, Recipe,
+                            IngredientRecipe, Favorite, Cart,
+                            ShoppingListItem, FeedInboxEntry)
+from recipes import counters, shopping_list, trending, versions
+from users.models import Follow
+from . import ingredient_index, uploads
+from .ingredient_index import IngredientIndex
+from .relations import RelationSet
+from .search import search_ingredients
+from .serializers import RecipeReadSerializer
+from .utils import SHOPPING_LIST_FORMATS, LRUBytesCache
+
+User = get_user_model()
+
+RECIPES_URL = '/api/recipes/'
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def image_data_uri(size=(1, 1), image_format='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, format=image_format)
+    encoded = base64.b64encode(buffer.getvalue()).decode()
+    return f'data:image/{image_format.lower()};base64,{encoded}'
+
+
+class RecipeFixturesMixin:
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com',
+            first_name='Reader', last_name='Reader', password='pass')
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com',
+            first_name='Author', last_name='Author', password='pass')
+        cls.tag = Tag.objects.create(name='Завтрак', color='#E26C2D',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г')
+
+    @classmethod
+    def create_recipes(cls, count, author=None):
+        recipes = []
+        for _ in range(count):
+            recipe = Recipe.objects.create(
+                author=author or cls.author, name='Блины',
+                text='Смешать и пожарить', cooking_time=10)
+            counters.recipes_changed(recipe.author_id, 1)
+            recipe.tags.add(cls.tag)
+            IngredientRecipe.objects.create(
+                recipe=recipe, ingredient=cls.ingredient, amount=200)
+            recipes.append(recipe)
+        return recipes
+
+
+class RecipeFlagsTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    @staticmethod
+    def flag_queries(context):
+        return [query['sql'] for query in context.captured_queries
+                if 'recipes_favorite' in query['sql']
+                or 'recipes_cart' in query['sql']]
+
+    def test_flags_reflect_user_lists(self):
+        favorited, carted, plain = self.create_recipes(3)
+        Favorite.objects.create(user=self.user, recipe=favorited)
+        Cart.objects.create(user=self.user, recipe=carted)
+
+        response = self.client.get(RECIPES_URL)
+
+        flags = {item['id']: (item['is_favorited'],
+                              item['is_in_shopping_cart'])
+                 for item in response.data['results']}
+        self.assertEqual(flags[favorited.id], (True, False))
+        self.assertEqual(flags[carted.id], (False, True))
+        self.assertEqual(flags[plain.id], (False, False))
+
+    def test_flags_for_anonymous_user(self):
+        self.create_recipes(1)
+        self.client.force_authenticate(None)
+
+        response = self.client.get(RECIPES_URL)
+
+        item = response.data['results'][0]
+        self.assertFalse(item['is_favorited'])
+        self.assertFalse(item['is_in_shopping_cart'])
+
+    def test_author_subscription_flag(self):
+        self.create_recipes(1)
+        Follow.objects.create(user=self.user, author=self.author)
+
+        response = self.client.get(RECIPES_URL)
+
+        self.assertTrue(
+            response.data['results'][0]['author']['is_subscribed'])
+
+    def test_flag_queries_do_not_depend_on_page_size(self):
+        self.create_recipes(1)
+        with CaptureQueriesContext(connection) as single_recipe:
+            self.client.get(RECIPES_URL)
+
+        self.create_recipes(8)
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(RECIPES_URL)
+
+        self.assertEqual(len(self.flag_queries(single_recipe)),
+                         len(self.flag_queries(full_page)))
+
+    def test_list_queries_do_not_depend_on_page_size(self):
+        self.create_recipes(1)
+        with CaptureQueriesContext(connection) as single_recipe:
+            self.client.get(RECIPES_URL)
+
+        self.create_recipes(8)
+        with self.assertNumQueries(len(single_recipe)):
+            self.client.get(RECIPES_URL)
+
+    def test_retrieve_query_count(self):
+        recipe, = self.create_recipes(1)
+
+        # recipe with annotations, tags, ingredients
+        with self.assertNumQueries(3):
+            self.client.get(f'{RECIPES_URL}{recipe.id}/')
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class RecipeWriteTests(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    def recipe_payload(self, **kwargs):
+        payload = {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'tags': [self.tag.id],
+            'image': image_data_uri(),
+            'name': 'Омлет',
+            'text': 'Взбить и пожарить',
+            'cooking_time': 5,
+        }
+        payload.update(kwargs)
+        return payload
+
+    def test_create_returns_read_representation(self):
+        response = self.client.post(RECIPES_URL, self.recipe_payload(),
+                                    format='json')
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['tags'][0]['slug'], 'breakfast')
+        self.assertEqual(response.data['ingredients'][0]['amount'], 10)
+        self.assertFalse(response.data['is_favorited'])
+        self.assertFalse(response.data['author']['is_subscribed'])
+
+    def test_partial_update_returns_read_representation(self):
+        recipe, = self.create_recipes(1)
+        Cart.objects.create(user=self.author, recipe=recipe)
+
+        response = self.client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            self.recipe_payload(name='Омлет с сыром'), format='json')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['name'], 'Омлет с сыром')
+        self.assertTrue(response.data['is_in_shopping_cart'])
+
+    def create_ingredients(self, count):
+        return Ingredient.objects.bulk_create(
+            Ingredient(name=f'ингредиент {index}', measurement_unit='г')
+            for index in range(count))
+
+    def patch_ingredients(self, recipe, amounts):
+        return self.client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            self.recipe_payload(ingredients=[
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient, amount in amounts]),
+            format='json')
+
+    def test_update_touches_only_changed_ingredients(self):
+        kept, changed, removed, added = self.create_ingredients(4)
+        recipe, = self.create_recipes(1)
+        recipe.ingredient_recipe.all().delete()
+        rows = IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(recipe=recipe, ingredient=ingredient, amount=10)
+            for ingredient in (kept, changed, removed))
+        Cart.objects.create(user=self.author, recipe=recipe)
+        shopping_list.rebuild()
+
+        response = self.patch_ingredients(
+            recipe, [(kept, 10), (changed, 25), (added, 5)])
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            dict(recipe.ingredient_recipe.values_list('ingredient_id', 'id')),
+            {kept.id: rows[0].id, changed.id: rows[1].id,
+             added.id: recipe.ingredient_recipe.get(ingredient=added).id})
+        self.assertEqual(
+            dict(self.author.shopping_list.values_list('ingredient_id',
+                                                       'amount')),
+            {kept.id: 10, changed.id: 25, added.id: 5})
+
+    def test_update_query_count_does_not_grow(self):
+        ingredients = self.create_ingredients(30)
+        recipe, = self.create_recipes(1)
+        self.patch_ingredients(recipe, [(ingredient, 1)
+                                        for ingredient in ingredients[:3]])
+        with CaptureQueriesContext(connection) as small:
+            self.patch_ingredients(
+                recipe, [(ingredient, 2) for ingredient in ingredients[:3]])
+        self.patch_ingredients(recipe, [(ingredient, 1)
+                                        for ingredient in ingredients])
+        with CaptureQueriesContext(connection) as large:
+            response = self.patch_ingredients(
+                recipe, [(ingredient, 2) for ingredient in ingredients])
+
+        self.assertEqual(len(response.data['ingredients']), 30)
+        self.assertEqual(len(large.captured_queries),
+                         len(small.captured_queries))
+
+    def test_ingredients_validated_in_one_query(self):
+        ingredients = self.create_ingredients(30)
+        payload = self.recipe_payload(ingredients=[
+            {'id': ingredient.id, 'amount': 1} for ingredient in ingredients
+        ] + [{'id': ingredients[-1].id + 1, 'amount': 1}])
+
+        with self.assertNumQueries(1):
+            response = self.client.post(RECIPES_URL, payload, format='json')
+
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp(), RECIPE_IMAGE_WORKERS=0)
+class RecipeImageTests(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(settings.MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_authenticate(self.author)
+
+    @staticmethod
+    def photo_data_uri(size=(2000, 1000)):
+        exif = Image.Exif()
+        exif[0x010F] = 'Camera maker'
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'green').save(buffer, 'JPEG',
+                                             exif=exif.tobytes())
+        encoded = base64.b64encode(buffer.getvalue()).decode()
+        return f'data:image/jpeg;base64,{encoded}'
+
+    def create_recipe(self, image):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(RECIPES_URL, {
+                'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+                'tags': [self.tag.id],
+                'image': image,
+                'name': 'Салат',
+                'text': 'Нарезать',
+                'cooking_time': 5,
+            }, format='json')
+        self.assertEqual(response.status_code, 201, response.data)
+        return Recipe.objects.get(pk=response.data['id'])
+
+    def test_original_is_stripped_and_named_by_content(self):
+        image = self.photo_data_uri()
+        first = self.create_recipe(image)
+        second = self.create_recipe(image)
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name,
+                         r'^recipes/images/[0-9a-f]{32}\.jpg$')
+        with Image.open(first.image.path) as stored:
+            self.assertEqual(len(stored.getexif()), 0)
+
+    def test_renditions(self):
+        recipe = self.create_recipe(self.photo_data_uri())
+
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        card = recipe.renditions['card']
+        self.assertEqual((card['width'], card['height']), (640, 320))
+        with default_storage.open(card['webp']) as rendition:
+            self.assertEqual(Image.open(rendition).format, 'WEBP')
+
+    def test_serializers_use_renditions(self):
+        recipe = self.create_recipe(self.photo_data_uri())
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_authenticate(self.user)
+
+        listed = self.client.get(RECIPES_URL).data['results'][0]
+        detail = self.client.get(f'{RECIPES_URL}{recipe.id}/').data
+        preview = self.client.get(
+            '/api/users/subscriptions/').data['results'][0]['recipes'][0]
+
+        self.assertTrue(listed['image'].endswith('/card.webp'))
+        self.assertTrue(detail['image'].endswith('/full.webp'))
+        self.assertTrue(preview['image'].endswith('/thumbnail.webp'))
+        self.assertTrue(
+            detail['image_renditions']['card']['jpeg'].endswith('.jpeg'))
+
+    def test_original_served_before_renditions(self):
+        recipe = self.create_recipe(self.photo_data_uri())
+        Recipe.objects.filter(pk=recipe.pk).update(renditions={})
+
+        response = self.client.get(f'{RECIPES_URL}{recipe.id}/')
+
+        self.assertTrue(response.data['image'].endswith(recipe.image.name))
+        self.assertEqual(response.data['image_renditions'], {})
+
+    @override_settings(RECIPE_IMAGE_MAX_SIDE=1000)
+    def test_too_large_image(self):
+        response = self.client.post(RECIPES_URL, {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'tags': [self.tag.id],
+            'image': self.photo_data_uri(),
+            'name': 'Салат',
+            'text': 'Нарезать',
+            'cooking_time': 5,
+        }, format='json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('image', response.data)
+
+    def test_multipart_upload(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (100, 100), 'green').save(buffer, 'PNG')
+        buffer.name = 'photo.png'
+        buffer.seek(0)
+
+        response = self.client.post(RECIPES_URL, {
+            'ingredients': json.dumps(
+                [{'id': self.ingredient.id, 'amount': 10}]),
+            'tags': json.dumps([self.tag.id]),
+            'image': buffer,
+            'name': 'Салат',
+            'text': 'Нарезать',
+            'cooking_time': 5,
+        }, format='multipart')
+
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual(response.data['ingredients'][0]['amount'], 10)
+        self.assertRegex(response.data['image'], r'/[0-9a-f]{32}\.jpg$')
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=1000)
+    def test_upload_size_limit(self):
+        for image in (image_data_uri(size=(200, 200), image_format='BMP'),
+                      self.photo_data_uri()):
+            with self.subTest(image=image[:15]):
+                response = self.client.post(RECIPES_URL, {
+                    'ingredients': [{'id': self.ingredient.id,
+                                     'amount': 10}],
+                    'tags': [self.tag.id],
+                    'image': image,
+                    'name': 'Салат',
+                    'text': 'Нарезать',
+                    'cooking_time': 5,
+                }, format='json')
+
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('МБ', response.data['image'][0])
+
+
+class DataUriDecodingTests(SimpleTestCase):
+
+    def test_matches_base64decode(self):
+        content = bytes(range(256)) * 41
+        for padding in range(3):
+            data = content[:len(content) - padding]
+            uri = ('data:image/png;base64,'
+                   + base64.b64encode(data).decode())
+            with self.subTest(padding=padding):
+                self.assertEqual(uploads.decoded_size(uri, 22), len(data))
+                with uploads.decode_data_uri(uri, chunk_size=64) as file:
+                    self.assertEqual(file.read(), data)
+
+    def test_invalid_data(self):
+        for uri in ('not an image', 'data:image/png;base64,abc',
+                    'data:image/png;base64,ab!d'):
+            with self.subTest(uri=uri):
+                with self.assertRaises(uploads.UploadError):
+                    uploads.decode_data_uri(uri)
+
+    @override_settings(RECIPE_IMAGE_MAX_UPLOAD_SIZE=10)
+    def test_size_checked_before_decoding(self):
+        uri = 'data:image/png;base64,' + 'A' * 16
+        with mock.patch('binascii.a2b_base64') as decode:
+            with self.assertRaises(uploads.UploadError):
+                uploads.decode_data_uri(uri)
+
+        decode.assert_not_called()
+
+
+class SubscriptionsTests(RecipeFixturesMixin, APITestCase):
+    url = '/api/users/subscriptions/'
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def follow_authors(self, count, recipes_per_author):
+        authors = []
+        offset = Follow.objects.filter(user=self.user).count()
+        for index in range(offset, offset + count):
+            author = User.objects.create_user(
+                username=f'author{index}',
+                email=f'author{index}@example.com',
+                first_name='Author', last_name='Author', password='pass')
+            self.create_recipes(recipes_per_author, author=author)
+            Follow.objects.create(user=self.user, author=author)
+            authors.append(author)
+        return authors
+
+    def test_recipes_limit(self):
+        author, = self.follow_authors(1, recipes_per_author=5)
+        newest = list(author.recipes.order_by('-pub_date', '-id')
+                      .values_list('id', flat=True)[:2])
+
+        response = self.client.get(self.url, {'recipes_limit': 2})
+
+        item = response.data['results'][0]
+        self.assertTrue(item['is_subscribed'])
+        self.assertEqual(item['recipes_count'], 5)
+        self.assertEqual([recipe['id'] for recipe in item['recipes']],
+                         newest)
+
+    def test_without_recipes_limit(self):
+        self.follow_authors(1, recipes_per_author=3)
+
+        response = self.client.get(self.url)
+
+        self.assertEqual(len(response.data['results'][0]['recipes']), 3)
+
+    def test_invalid_recipes_limit(self):
+        response = self.client.get(self.url, {'recipes_limit': 'many'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_do_not_depend_on_number_of_authors(self):
+        self.follow_authors(1, recipes_per_author=3)
+        with CaptureQueriesContext(connection) as single_author:
+            self.client.get(self.url, {'recipes_limit': 2})
+
+        self.follow_authors(5, recipes_per_author=3)
+        with self.assertNumQueries(len(single_author)):
+            self.client.get(self.url, {'recipes_limit': 2})
+
+    def test_subscribe_response_respects_recipes_limit(self):
+        self.create_recipes(3)
+
+        response = self.client.post(
+            f'/api/users/{self.author.id}/subscribe/?recipes_limit=1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['recipes']), 1)
+        self.assertEqual(response.data['recipes_count'], 3)
+        self.assertTrue(response.data['is_subscribed'])
+
+
+class ShoppingListTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def shopping_list(self, user=None):
+        return dict(ShoppingListItem.objects.filter(
+            user=user or self.user).values_list('ingredient_id', 'amount'))
+
+    def test_cart_changes_update_shopping_list(self):
+        first, second = self.create_recipes(2)
+
+        self.client.post(f'{RECIPES_URL}{first.id}/shopping_cart/')
+        self.client.post(f'{RECIPES_URL}{second.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {self.ingredient.id: 400})
+
+        self.client.delete(f'{RECIPES_URL}{first.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {self.ingredient.id: 200})
+
+        self.client.delete(f'{RECIPES_URL}{second.id}/shopping_cart/')
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_recipe_update_changes_carted_lists(self):
+        recipe, = self.create_recipes(1)
+        sugar = Ingredient.objects.create(name='сахар',
+                                          measurement_unit='г')
+        self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+        self.client.force_authenticate(self.author)
+
+        with override_settings(MEDIA_ROOT=MEDIA_ROOT):
+            self.client.patch(f'{RECIPES_URL}{recipe.id}/', {
+                'ingredients': [{'id': sugar.id, 'amount': 30}],
+                'tags': [self.tag.id],
+                'image': image_data_uri(),
+                'name': 'Блины', 'text': 'Сладкие', 'cooking_time': 10,
+            }, format='json')
+
+        self.assertEqual(self.shopping_list(), {sugar.id: 30})
+
+    def test_recipe_delete_changes_carted_lists(self):
+        recipe, = self.create_recipes(1)
+        self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+        self.client.force_authenticate(self.author)
+
+        self.client.delete(f'{RECIPES_URL}{recipe.id}/')
+
+        self.assertEqual(self.shopping_list(), {})
+
+    def test_download_reads_shopping_list(self):
+        recipe, = self.create_recipes(1)
+        self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                f'{RECIPES_URL}download_shopping_cart/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('recipes_ingredientrecipe' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_download_etag(self):
+        first, second = self.create_recipes(2)
+        url = f'{RECIPES_URL}download_shopping_cart/'
+        self.client.post(f'{RECIPES_URL}{first.id}/shopping_cart/')
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.client.post(f'{RECIPES_URL}{second.id}/shopping_cart/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def download(self, export_format):
+        return self.client.get(f'{RECIPES_URL}download_shopping_cart/',
+                               {'format': export_format})
+
+    def test_streaming_exports(self):
+        recipe, = self.create_recipes(1)
+        self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+
+        response = self.download('json')
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            json.loads(b''.join(response.streaming_content)),
+            [{'name': 'мука', 'amount': 200, 'measurement_unit': 'г'}])
+
+        response = self.download('csv')
+        self.assertEqual(
+            b''.join(response.streaming_content).decode().splitlines(),
+            ['ингредиент,количество,единица измерения', 'мука,200,г'])
+
+        response = self.download('txt')
+        self.assertEqual(b''.join(response.streaming_content).decode(),
+                         'мука (г) — 200\n')
+
+    def test_pdf_export_and_unknown_format(self):
+        self.assertEqual(self.download('pdf')['Content-Type'],
+                         'application/pdf')
+        self.assertEqual(self.download('docx').status_code, 400)
+
+    def test_anonymous_download(self):
+        self.client.force_authenticate(None)
+
+        for export_format in SHOPPING_LIST_FORMATS:
+            self.assertEqual(self.download(export_format).status_code, 401)
+
+
+class LRUBytesCacheTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = LRUBytesCache(max_size=10)
+        cache.set('a', b'aaaa')
+        cache.set('b', b'bbbb')
+        cache.get('a')
+        cache.set('c', b'cccc')
+
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertEqual(cache.size, 8)
+
+    def test_skips_values_over_limit(self):
+        cache = LRUBytesCache(max_size=2)
+        cache.set('a', b'aaa')
+
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.size, 0)
+
+
+class IngredientSearchTests(APITestCase):
+    url = '/api/ingredients/'
+    # the version of the in-memory index
+    search_queries = 1
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in ['сгущённое молоко', 'молоко', 'молоко козье',
+                         'мука', 'кокосовое молоко'])
+        versions.bump_version(versions.INGREDIENTS)
+
+    def setUp(self):
+        cache.clear()
+
+    def names(self, response):
+        return [item['name'] for item in response.data]
+
+    def test_prefix_matches_come_first(self):
+        response = self.client.get(self.url, {'name': 'Молоко'})
+
+        self.assertEqual(self.names(response),
+                         ['молоко', 'молоко козье',
+                          'кокосовое молоко', 'сгущённое молоко'])
+
+    def test_limit(self):
+        response = self.client.get(self.url, {'name': 'молоко',
+                                              'limit': 3})
+
+        self.assertEqual(self.names(response),
+                         ['молоко', 'молоко козье', 'кокосовое молоко'])
+
+    @override_settings(INGREDIENT_SEARCH_LIMIT=2)
+    def test_empty_query_is_limited(self):
+        response = self.client.get(self.url)
+
+        self.assertEqual(self.names(response),
+                         ['кокосовое молоко', 'молоко'])
+
+    def test_legacy_search_param(self):
+        response = self.client.get(self.url, {'search': 'мук'})
+
+        self.assertEqual(self.names(response), ['мука'])
+
+    def test_invalid_limit(self):
+        response = self.client.get(self.url, {'limit': 'all'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_full_prefix_page_query_count(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(self.search_queries):
+            self.client.get(self.url, {'name': 'молоко', 'limit': 2})
+
+
+@override_settings(INGREDIENT_SEARCH_BACKEND='database')
+class DatabaseIngredientSearchTests(IngredientSearchTests):
+    search_queries = 1
+
+
+class IngredientIndexTests(APITestCase):
+
+    def test_normalizes_case_and_yo(self):
+        index = IngredientIndex([(1, 'Ёжевика', 'г'), (2, 'тёртый сыр', 'г'),
+                                 (3, 'сыр', 'г')])
+
+        self.assertEqual([item['id'] for item in index.search('еж', 10)],
+                         [1])
+        self.assertEqual([item['id'] for item in index.search('СЫР', 10)],
+                         [3, 2])
+        self.assertEqual(index.search('ТЕРТ', 10),
+                         [{'id': 2, 'name': 'тёртый сыр',
+                           'measurement_unit': 'г'}])
+
+    def test_rebuilt_after_ingredient_change(self):
+        Ingredient.objects.create(name='укроп', measurement_unit='г')
+        self.assertEqual(len(ingredient_index.get_index().search('укр', 5)),
+                         1)
+
+        Ingredient.objects.create(name='укропное масло',
+                                  measurement_unit='мл')
+
+        self.assertEqual(len(ingredient_index.get_index().search('укр', 5)),
+                         2)
+
+    def test_rebuilt_after_import_in_another_process(self):
+        self.assertEqual(ingredient_index.get_index().search('укр', 5), [])
+
+        # the command runs with a cache of its own, as under gunicorn
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'set-ingredients'}}), \
+                mock.patch('sys.stdin', io.StringIO('укроп,г\n')):
+            call_command('set-ingredients', '-', stdout=io.StringIO())
+
+        self.assertEqual(len(ingredient_index.get_index().search('укр', 5)),
+                         1)
+
+    def test_same_results_as_database(self):
+        names = ['сгущённое молоко', 'молоко', 'молоко козье', 'мука',
+                 'кокосовое молоко', 'соль', 'соль морская', 'фасоль']
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г') for name in names)
+        index = ingredient_index.build_index()
+
+        for term in ('', 'МОЛОКО', 'Молоко К', 'олок', 'сгущённ', 'СОЛЬ',
+                     'ль', 'нет такого'):
+            for limit in (2, 10):
+                with self.subTest(term=term, limit=limit):
+                    self.assertEqual(
+                        index.search(term, limit),
+                        [{'id': item.id, 'name': item.name,
+                          'measurement_unit': item.measurement_unit}
+                         for item in search_ingredients(term, limit)])
+
+    def test_term_does_not_match_across_names(self):
+        index = IngredientIndex([(1, 'ab', 'г'), (2, 'cd', 'г')])
+
+        self.assertEqual(index.search('b\nc', 10), [])
+
+
+class ReferenceDataCacheTests(APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com',
+            first_name='Admin', last_name='Admin', password='pass')
+        cls.tag = Tag.objects.create(name='Обед', color='#49B64E',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(name='соль',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_headers_and_not_modified(self):
+        response = self.client.get('/api/tags/')
+
+        self.assertIn('ETag', response)
+        self.assertIn('Last-Modified', response)
+        self.assertIn('max-age', response['Cache-Control'])
+        response = self.client.get('/api/tags/',
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_cached_response_reads_only_version(self):
+        self.client.get(f'/api/tags/{self.tag.id}/')
+
+        with self.assertNumQueries(1):
+            response = self.client.get(f'/api/tags/{self.tag.id}/')
+        self.assertEqual(response.data['slug'], 'lunch')
+
+    def test_admin_tag_edit_invalidates_cache(self):
+        etag = self.client.get('/api/tags/')['ETag']
+        self.client.force_login(self.admin)
+
+        self.client.post(f'/admin/recipes/tag/{self.tag.id}/change/', {
+            'name': 'Ужин', 'color': '#8775D2', 'slug': 'dinner'})
+
+        response = self.client.get('/api/tags/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data[0]['slug'], 'dinner')
+
+    def test_admin_ingredient_edit_invalidates_cache(self):
+        self.client.get('/api/ingredients/', {'name': 'сол'})
+        self.client.force_login(self.admin)
+
+        self.client.post(
+            f'/admin/recipes/ingredient/{self.ingredient.id}/change/',
+            {'name': 'соль морская', 'measurement_unit': 'г'})
+
+        response = self.client.get('/api/ingredients/', {'name': 'сол'})
+        self.assertEqual(response.data[0]['name'], 'соль морская')
+
+
+class RecipePaginationTests(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(20)
+        # ties on pub_date are broken by id
+        Recipe.objects.filter(id__in=[recipe.id for recipe in
+                                      cls.recipes[5:15]]).update(
+            pub_date=cls.recipes[5].pub_date)
+
+    def expected_ids(self):
+        return list(Recipe.objects.order_by('-pub_date', '-id')
+                    .values_list('id', flat=True))
+
+    def test_cursor_walks_whole_feed(self):
+        ids = []
+        url = f'{RECIPES_URL}?cursor='
+        while url:
+            response = self.client.get(url)
+            self.assertIsNone(response.data['previous'])
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+
+        self.assertEqual(ids, self.expected_ids())
+
+    def test_cursor_does_not_count(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(RECIPES_URL, {'cursor': ''})
+
+        self.assertIsNone(response.data['count'])
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in context.captured_queries))
+
+    def test_invalid_cursor(self):
+        response = self.client.get(RECIPES_URL, {'cursor': 'broken'})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_page_without_count(self):
+        response = self.client.get(RECIPES_URL, {'count': 0, 'page': 3})
+
+        self.assertIsNone(response.data['count'])
+        self.assertIsNone(response.data['next'])
+        self.assertIn('page=2', response.data['previous'])
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         self.expected_ids()[18:])
+
+    def test_page_number_contract(self):
+        response = self.client.get(RECIPES_URL, {'page': 2})
+
+        self.assertEqual(response.data['count'], 20)
+        self.assertEqual([item['id'] for item in response.data['results']],
+                         self.expected_ids()[9:18])
+
+    @override_settings(RECIPE_PAGINATION_MAX_COUNT=10)
+    def test_count_is_exact_by_default(self):
+        response = self.client.get(RECIPES_URL, {'page': 2})
+
+        self.assertEqual(response.data['count'], 20)
+        self.assertIn('page=3', response.data['next'])
+        self.assertEqual(self.client.get(
+            RECIPES_URL, {'page': 3}).status_code, 200)
+
+    @override_settings(RECIPE_PAGINATION_MAX_COUNT=10)
+    def test_count_is_capped_on_request(self):
+        response = self.client.get(RECIPES_URL, {'count': 'capped'})
+
+        self.assertEqual(response.data['count'], 10)
+        self.assertIn('count=capped', response.data['next'])
+
+
+class RecipeTagFilterTests(RecipeFixturesMixin, APITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.lunch = Tag.objects.create(name='Обед', color='#49B64E',
+                                       slug='lunch')
+        cls.breakfast_only, cls.both = cls.create_recipes(2)
+        cls.both.tags.add(cls.lunch)
+        cls.lunch_only = Recipe.objects.create(
+            author=cls.author, name='Суп', text='Сварить', cooking_time=30)
+        cls.lunch_only.tags.add(cls.lunch)
+
+    def setUp(self):
+        cache.clear()
+
+    def filtered_ids(self, **params):
+        response = self.client.get(RECIPES_URL, params)
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(response.data['count'], len(ids))
+        return sorted(ids)
+
+    def test_any_mode_has_no_duplicates(self):
+        self.assertEqual(
+            self.filtered_ids(tags=['breakfast', 'lunch']),
+            sorted([self.breakfast_only.id, self.both.id,
+                    self.lunch_only.id]))
+
+    def test_all_mode(self):
+        self.assertEqual(
+            self.filtered_ids(tags=['breakfast', 'lunch'], tags_mode='all'),
+            [self.both.id])
+
+    def test_unknown_slugs(self):
+        self.assertEqual(self.filtered_ids(tags=['dinner', 'lunch']),
+                         sorted([self.both.id, self.lunch_only.id]))
+        self.assertEqual(self.filtered_ids(tags=['dinner']), [])
+        self.assertEqual(
+            self.filtered_ids(tags=['dinner', 'lunch'], tags_mode='all'), [])
+
+    def test_invalid_mode(self):
+        response = self.client.get(RECIPES_URL, {'tags': 'lunch',
+                                                 'tags_mode': 'some'})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_slugs_are_matched_in_subquery(self):
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(RECIPES_URL, {'tags': ['breakfast', 'lunch']})
+
+        tables = [re.search(r'FROM "(\w+)"', query['sql']).group(1)
+                  for query in context.captured_queries]
+        # count, page, then tags and ingredients of the page
+        self.assertEqual(tables, ['recipes_recipe', 'recipes_recipe',
+                                  'recipes_tag', 'recipes_ingredientrecipe'])
+        for query in context.captured_queries[:2]:
+            self.assertIn('"slug" IN (', query['sql'])
+
+
+class CountersTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_counters_follow_api_actions(self):
+        first, second = self.create_recipes(2)
+        for url in ('favorite', 'shopping_cart'):
+            self.client.post(f'{RECIPES_URL}{first.id}/{url}/')
+        self.client.post(f'{RECIPES_URL}{second.id}/favorite/')
+        self.client.delete(f'{RECIPES_URL}{second.id}/favorite/')
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual((first.favorites_count, first.cart_count), (1, 1))
+        self.assertEqual(second.favorites_count, 0)
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (2, 1))
+        self.assertEqual(counters.recount(fix=False), dict.fromkeys(
+            ['recipe.favorites_count', 'recipe.cart_count',
+             'profileuser.recipes_count', 'profileuser.followers_count',
+             'profileuser.following_count'],
+            0))
+
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.client.force_authenticate(self.author)
+        self.client.delete(f'{RECIPES_URL}{first.id}/')
+
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.author.recipes_count, self.author.followers_count), (1, 0))
+
+    def test_ordering_by_favorites(self):
+        recipes = self.create_recipes(4)
+        for recipe, count in zip(recipes, (2, 0, 5, 2)):
+            Recipe.objects.filter(pk=recipe.pk).update(favorites_count=count)
+
+        response = self.client.get(RECIPES_URL,
+                                   {'ordering': '-favorites_count'})
+
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [recipes[2].id, recipes[3].id, recipes[0].id, recipes[1].id])
+
+
+class ToggleTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_repeated_toggles_change_nothing(self):
+        recipe, = self.create_recipes(1)
+        url = f'{RECIPES_URL}{recipe.id}/shopping_cart/'
+        statuses = [self.client.post(url).status_code,
+                    self.client.post(url).status_code,
+                    self.client.delete(url).status_code,
+                    self.client.delete(url).status_code]
+
+        self.assertEqual(statuses, [201, 400, 204, 400])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.cart_count, 0)
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_unknown_recipe(self):
+        for method in (self.client.post, self.client.delete):
+            response = method(f'{RECIPES_URL}0/favorite/')
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('не найден', response.data['errors'])
+
+    def test_add_is_one_insert(self):
+        recipe, = self.create_recipes(1)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(f'{RECIPES_URL}{recipe.id}/favorite/')
+
+        inserts = [query['sql'] for query in queries.captured_queries
+                   if query['sql'].startswith('INSERT')]
+        self.assertEqual(len(inserts), 1)
+        self.assertIn('ON CONFLICT DO NOTHING', inserts[0])
+
+    def test_follow_toggles(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        statuses = [self.client.post(url).status_code,
+                    self.client.post(url).status_code,
+                    self.client.delete(url).status_code,
+                    self.client.delete(url).status_code]
+
+        self.assertEqual(statuses, [200, 400, 204, 400])
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+    def test_self_subscription_refused(self):
+        response = self.client.post(f'/api/users/{self.user.id}/subscribe/')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Follow.objects.exists())
+
+
+# an in-memory SQLite database does not allow concurrent writers
+@skipIf(connection.vendor == 'sqlite', 'needs a database server')
+class ConcurrentToggleTests(TransactionTestCase):
+    THREADS = 8
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='pass')
+        self.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='Блины', text='Смешать и пожарить',
+            cooking_time=10)
+
+    def in_parallel(self, method, url):
+        barrier = threading.Barrier(self.THREADS)
+        statuses = []
+
+        def toggle():
+            client = APIClient()
+            client.force_authenticate(self.user)
+            barrier.wait()
+            try:
+                statuses.append(getattr(client, method)(url).status_code)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=toggle)
+                   for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sorted(statuses)
+
+    def test_parallel_favorite(self):
+        url = f'{RECIPES_URL}{self.recipe.id}/favorite/'
+        losers = [400] * (self.THREADS - 1)
+
+        self.assertEqual(self.in_parallel('post', url), [201] + losers)
+        self.assertEqual(self.in_parallel('delete', url), [204] + losers)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.favorites_count, 0)
+
+    def test_parallel_follow(self):
+        url = f'/api/users/{self.author.id}/subscribe/'
+        losers = [400] * (self.THREADS - 1)
+
+        self.assertEqual(self.in_parallel('post', url), [200] + losers)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 1)
+        self.assertEqual(self.in_parallel('delete', url), [204] + losers)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.followers_count, 0)
+
+
+class TokenAuthenticationTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(
+            HTTP_AUTHORIZATION=f'Token {self.token.key}')
+
+    def test_logout_rejects_token(self):
+        self.client.post('/api/auth/token/logout/')
+
+        response = self.client.get('/api/users/me/')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_token_deleted_by_another_process_is_rejected(self):
+        self.assertEqual(self.client.get('/api/users/me/').status_code, 200)
+
+        with override_settings(CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'another-worker'}}):
+            self.token.delete()
+
+        response = self.client.get('/api/users/me/')
+
+        self.assertEqual(response.status_code, 401)
+
+    def test_follow_updates_feed_source(self):
+        self.client.post(f'/api/users/{self.author.id}/subscribe/')
+
+        with mock.patch('recipes.feed.uses_inbox',
+                        return_value=False) as uses_inbox:
+            self.client.get(f'{RECIPES_URL}feed/')
+
+        uses_inbox.assert_called_with(1)
+
+
+class UserRelationsTests(RecipeFixturesMixin, APITestCase):
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_user_list_checks_subscriptions_once(self):
+        def list_users():
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get('/api/users/')
+            return response, len(queries)
+
+        _, before = list_users()
+        for number in range(5):
+            User.objects.create_user(
+                username=f'cook{number}', email=f'cook{number}@example.com',
+                password='pass')
+        Follow.objects.create(user=self.user, author=self.author)
+        response, after = list_users()
+
+        self.assertEqual(after, before)
+        self.assertEqual(
+            {user['id'] for user in response.data['results']
+             if user['is_subscribed']},
+            {self.author.id})
+
+    def test_recipe_flags_without_annotations(self):
+        recipe, = self.create_recipes(1)
+        Cart.objects.create(user=self.user, recipe=recipe)
+        request = mock.Mock(spec=['user'], user=self.user)
+
+        data = RecipeReadSerializer(recipe, context={'request': request}).data
+
+        self.assertEqual((data['is_favorited'], data['is_in_shopping_cart']),
+                         (False, True))
+
+    @override_settings(RELATION_SET_LIMIT=1)
+    def test_large_sets_are_queried_per_page(self):
+        authors = [User.objects.create_user(
+            username=f'cook{number}', email=f'cook{number}@example.com',
+            password='pass') for number in range(3)]
+        for author in authors[:2]:
+            Follow.objects.create(user=self.user, author=author)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/users/', {'limit': 10})
+
+        follow_queries = [query['sql'] for query in queries.captured_queries
+                          if 'users_follow' in query['sql']]
+        self.assertEqual(len(follow_queries), 2)
+        self.assertIn(' IN ', follow_queries[-1])
+        self.assertEqual(
+            {user['id'] for user in response.data['results']
+             if user['is_subscribed']},
+            {author.id for author in authors[:2]})
+
+    def test_relation_set_looks_up_scope_together(self):
+        recipes = self.create_recipes(3)
+        for recipe in recipes[:2]:
+            Favorite.objects.create(user=self.user, recipe=recipe)
+        favorites = RelationSet(Favorite.objects.filter(user=self.user),
+                                'recipe_id', size=2)
+        favorites.expect(recipe.id for recipe in recipes)
+
+        with override_settings(RELATION_SET_LIMIT=1), \
+                self.assertNumQueries(1):
+            found = [recipe.id in favorites for recipe in recipes]
+
+        self.assertEqual(found, [True, True, False])
+
+
+class ExplainRecipeFiltersCommandTests(TestCase):
+
+    def test_explains_every_combination(self):
+        stdout = io.StringIO()
+
+        call_command('explain-recipe-filters', '--recipes=30', '--users=5',
+                     stdout=stdout)
+
+        labels = [line.split(':')[0] for line in stdout.getvalue().splitlines()
+                  if line.endswith(': ok') or ': sequential scan on ' in line]
+        # 16 combinations of 4 filters, 8 of them with tags also in all mode
+        self.assertEqual(len(labels), 24)
+        self.assertIn('(no filters)', labels)
+        self.assertEqual(
+            len([label for label in labels if 'tags_mode=all' in label]), 8)
+        self.assertFalse(Recipe.objects.exists())
+
+
+class SeedCommandTests(TestCase):
+
+    def seed(self, prefix):
+        call_command('seed', '--users=30', '--recipes=200', '--tags=3',
+                     '--batch-size=50', f'--prefix={prefix}',
+                     stdout=io.StringIO())
+        return list(User.objects.filter(username__startswith=prefix).order_by(
+            'pk').values_list('recipes_count', flat=True))
+
+    def favorites(self, prefix):
+        '''Favorites of seeded users, independent of primary keys.'''
+        return {(username[len(prefix):], name)
+                for username, name in Favorite.objects.filter(
+                    user__username__startswith=prefix).values_list(
+                    'user__username', 'recipe__name')}
+
+    def test_seed(self):
+        tags_version = versions.get_version(versions.TAGS)
+        recipes_per_author = self.seed('first')
+
+        self.assertEqual(Recipe.objects.count(), 200)
+        self.assertEqual(sum(recipes_per_author), 200)
+        # popular authors have far more recipes than the median one
+        self.assertGreater(max(recipes_per_author),
+                           4 * sorted(recipes_per_author)[15])
+        self.assertTrue(IngredientRecipe.objects.exists())
+        self.assertTrue(Favorite.objects.exists())
+        self.assertEqual(sum(counters.recount(fix=False).values()), 0)
+        self.assertNotEqual(versions.get_version(versions.TAGS),
+                            tags_version)
+        self.assertEqual(self.seed('second'), recipes_per_author)
+        self.assertEqual(self.favorites('second'), self.favorites('first'))
+
+        with self.assertRaises(CommandError):
+            self.seed('first')
+
+
+class BenchCommandTests(TestCase):
+
+    def bench(self, *args):
+        call_command('bench', '--users=30', '--recipes=120', '--repeat=2',
+                     *args, stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_report_and_baseline(self):
+        report_path = os.path.join(tempfile.mkdtemp(), 'report.json')
+        self.bench(f'--output={report_path}')
+        with open(report_path, encoding='utf-8') as file:
+            report = json.load(file)
+        endpoints = report['endpoints']
+
+        self.assertIn('GET /api/recipes/?author&tags&is_favorited',
+                      endpoints)
+        for name in ('GET /api/recipes/download_shopping_cart/?format=pdf',
+                     'PATCH /api/recipes/{id}/',
+                     'DELETE /api/users/{id}/subscribe/'):
+            self.assertEqual(set(endpoints[name]),
+                             {'min', 'p50', 'p95', 'max', 'queries',
+                              'peak_kib'})
+        # the token and the version of the cached response
+        self.assertEqual(endpoints['GET /api/tags/']['queries'], 2)
+        self.assertFalse(Recipe.objects.exists())
+
+        endpoints['GET /api/users/me/']['queries'] = 0
+        with open(report_path, 'w', encoding='utf-8') as file:
+            json.dump(report, file)
+        with self.assertRaisesMessage(CommandError, '1 regressions'):
+            self.bench('--only=users/me', f'--baseline={report_path}')
+
+
+class TrendingEndpointTests(RecipeFixturesMixin, APITestCase):
+    url = f'{RECIPES_URL}trending/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.recipes = cls.create_recipes(3)
+        for recipe, count in zip(cls.recipes, (2, 4, 1)):
+            for index in range(count):
+                fan = User.objects.create_user(
+                    username=f'fan{recipe.id}_{index}',
+                    email=f'fan{recipe.id}_{index}@example.com',
+                    first_name='Fan', last_name='Fan')
+                Favorite.objects.create(user=fan, recipe=recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+
+    def setUp(self):
+        cache.clear()
+        trending.refresh()
+        self.client.force_authenticate(self.user)
+
+    def test_ranking(self):
+        first, second, third = self.recipes
+
+        response = self.client.get(self.url, {'tag': 'breakfast'})
+
+        self.assertEqual([item['id'] for item in response.data],
+                         [second.id, first.id, third.id])
+        self.assertTrue(response.data[1]['is_favorited'])
+        self.assertEqual(
+            len(self.client.get(self.url, {'limit': 1}).data), 1)
+
+    def test_unknown_tag(self):
+        response = self.client.get(self.url, {'tag': 'dinner'})
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_ranking_is_cached_until_refresh(self):
+        self.client.get(self.url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(self.url)
+        self.assertFalse(any('recipes_trendingrank' in query['sql']
+                             for query in context.captured_queries))
+
+        Favorite.objects.filter(recipe=self.recipes[1]).delete()
+        trending.refresh(full=True)
+
+        response = self.client.get(self.url)
+        self.assertNotIn(self.recipes[1].id,
+                         [item['id'] for item in response.data])
+
+
+class FeedTests(RecipeFixturesMixin, APITestCase):
+    url = f'{RECIPES_URL}feed/'
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = User.objects.create_user(
+            username='other', email='other@example.com',
+            first_name='Other', last_name='Other', password='pass')
+        cls.stranger = User.objects.create_user(
+            username='stranger', email='stranger@example.com',
+            first_name='Stranger', last_name='Stranger', password='pass')
+        cls.create_recipes(7)
+        cls.create_recipes(6, author=cls.other)
+        cls.create_recipes(2, author=cls.stranger)
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def follow(self, *authors, method='post'):
+        for author in authors:
+            response = getattr(self.client, method)(
+                f'/api/users/{author.id}/subscribe/')
+            self.assertLess(response.status_code, 300)
+
+    def feed_ids(self):
+        ids = []
+        url = self.url
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIsNone(response.data['count'])
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def expected_ids(self, *authors):
+        return list(Recipe.objects.filter(author__in=authors).order_by(
+            '-pub_date', '-id').values_list('id', flat=True))
+
+    def publish(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.post(RECIPES_URL, {
+            'ingredients': [{'id': self.ingredient.id, 'amount': 10}],
+            'tags': [self.tag.id],
+            'image': image_data_uri(),
+            'name': 'Новый рецепт',
+            'text': 'Текст',
+            'cooking_time': 5,
+        }, format='json')
+        self.client.force_authenticate(self.user)
+        return response.data['id']
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+
+        self.assertEqual(self.client.get(self.url).status_code, 401)
+
+    @override_settings(FEED_INBOX_THRESHOLD=None)
+    def test_followed_authors_only(self):
+        self.follow(self.author, self.other)
+
+        self.assertEqual(self.feed_ids(),
+                         self.expected_ids(self.author, self.other))
+        self.assertFalse(FeedInboxEntry.objects.exists())
+
+    @override_settings(FEED_INBOX_THRESHOLD=1, MEDIA_ROOT=MEDIA_ROOT)
+    def test_inbox(self):
+        self.follow(self.author)
+        self.assertFalse(FeedInboxEntry.objects.exists())
+
+        self.follow(self.other)
+        self.assertEqual(FeedInboxEntry.objects.filter(user=self.user)
+                         .count(), 13)
+        published = self.publish()
+        ids = self.feed_ids()
+
+        self.assertEqual(ids[0], published)
+        self.assertEqual(ids, self.expected_ids(self.author, self.other))
+
+        self.follow(self.stranger)
+        self.follow(self.other, method='delete')
+        self.assertEqual(self.feed_ids(),
+                         self.expected_ids(self.author, self.stranger))
+
+        self.follow(self.stranger, method='delete')
+        self.assertFalse(FeedInboxEntry.objects.exists())
+        self.assertEqual(self.feed_ids(), self.expected_ids(self.author))
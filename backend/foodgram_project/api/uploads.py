@@ -0,0 +1,66 @@
+'''
+Decoding of images uploaded as base64 data URIs.
+
+The encoded string is decoded in chunks into a spooled temporary file,
+so the upload is not held in memory a second and a third time as a
+split copy and as decoded bytes. The decoded size is known from the
+length of the string, so oversized uploads are rejected before any
+decoding.
+'''
+import binascii
+import re
+import tempfile
+
+from django.conf import settings
+
+# a multiple of 4, so every chunk holds whole base64 quantums
+CHUNK_SIZE = 64 * 1024
+DATA_URI_HEADER = re.compile(r'data:image/[\w.+-]+;base64,')
+
+
+class UploadError(ValueError):
+    pass
+
+
+def decoded_size(encoded, start):
+    '''Size of the data base64 encoded in encoded[start:].'''
+    length = len(encoded) - start
+    padding = 0
+    if encoded.endswith('=='):
+        padding = 2
+    elif encoded.endswith('='):
+        padding = 1
+    return length // 4 * 3 - padding
+
+
+def check_size(size):
+    if size > settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE:
+        raise UploadError(
+            'Размер изображения не должен превышать '
+            f'{settings.RECIPE_IMAGE_MAX_UPLOAD_SIZE // 1024 // 1024} МБ')
+
+
+def decode_data_uri(data, chunk_size=CHUNK_SIZE):
+    '''
+    Decode a "data:image/...;base64,..." string into a temporary file
+    positioned at the start. The file is kept in memory up to
+    FILE_UPLOAD_MAX_MEMORY_SIZE and spills to disk above that.
+    '''
+    header = DATA_URI_HEADER.match(data)
+    if header is None:
+        raise UploadError('Ожидается изображение в формате data URI')
+    start = header.end()
+    if (len(data) - start) % 4:
+        raise UploadError('Некорректные данные base64')
+    check_size(decoded_size(data, start))
+    file = tempfile.SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE)
+    try:
+        for offset in range(start, len(data), chunk_size):
+            file.write(binascii.a2b_base64(
+                data[offset:offset + chunk_size]))
+    except binascii.Error:
+        file.close()
+        raise UploadError('Некорректные данные base64')
+    file.seek(0)
+    return file
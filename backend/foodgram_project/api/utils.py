@@ -1,32 +1,143 @@
+import csv
+import hashlib
 import io
+import json
+import os
+import threading
+from collections import OrderedDict
 
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.platypus import Table, SimpleDocTemplate, TableStyle
 from reportlab.lib import colors
-from django.db import models
-from django.http import FileResponse
-from recipes.models import IngredientRecipe
+from django.conf import settings
+from django.http import (FileResponse, HttpResponseNotModified,
+                         StreamingHttpResponse)
+from django.utils.http import parse_etags, quote_etag
 
+# bump when the layout of the generated document changes
+PDF_TEMPLATE_VERSION = 1
+
+SHOPPING_LIST_HEADER = ('ингредиент', 'количество', 'единица измерения')
 
-def pdf_maker(request):
-    buffer = io.BytesIO()
 
+def register_fonts():
     pdfmetrics.registerFont(
         TTFont('TimesNewRoman',
-               'static_backend/api/fonts/times new roman.ttf'))
-    recipes = request.user.recipes_in_cart.all()
-    queryset = IngredientRecipe.objects.filter(
-        recipe__in=recipes).values(
+               os.path.join(settings.BASE_DIR,
+                            'static_backend/api/fonts/times new roman.ttf')))
+
+
+class LRUBytesCache:
+    '''Thread-safe LRU cache of bytes values limited by total size.'''
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.size = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        if len(value) > self.max_size:
+            return
+        with self._lock:
+            old_value = self._data.pop(key, None)
+            if old_value is not None:
+                self.size -= len(old_value)
+            while self._data and self.size + len(value) > self.max_size:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+            self._data[key] = value
+            self.size += len(value)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+
+pdf_cache = LRUBytesCache(settings.SHOPPING_LIST_PDF_CACHE_SIZE)
+
+
+def shopping_list_rows(user, chunk_size=2000):
+    '''
+    Yield (name, amount, measurement_unit) rows of user's shopping list
+    reading them from a server-side cursor.
+    '''
+    return user.shopping_list.order_by(
+        'ingredient__name').values_list(
         'ingredient__name',
+        'amount',
         'ingredient__measurement_unit'
-    ).annotate(amount=models.Sum('amount'))
-    content = [('ингредиент', 'количество', 'единица измерения'), ]
-    for item in queryset:
-        content.append(
-            (item['ingredient__name'],
-                item['amount'],
-                item['ingredient__measurement_unit']))
+    ).iterator(chunk_size=chunk_size)
+
+
+class Echo:
+    '''File-like object which returns written value, for csv.writer.'''
+
+    def write(self, value):
+        return value
+
+
+def render_txt(rows):
+    for name, amount, measurement_unit in rows:
+        yield f'{name} ({measurement_unit}) — {amount}\n'
+
+
+def render_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def render_json(rows):
+    yield '['
+    separator = ''
+    for name, amount, measurement_unit in rows:
+        yield separator + json.dumps({
+            'name': name,
+            'amount': amount,
+            'measurement_unit': measurement_unit}, ensure_ascii=False)
+        separator = ', '
+    yield ']'
+
+
+STREAMING_EXPORTS = {
+    'txt': (render_txt, 'text/plain; charset=utf-8'),
+    'csv': (render_csv, 'text/csv; charset=utf-8'),
+    'json': (render_json, 'application/json'),
+}
+
+SHOPPING_LIST_FORMATS = ['pdf', *STREAMING_EXPORTS]
+
+
+def stream_shopping_list(request, export_format):
+    renderer, content_type = STREAMING_EXPORTS[export_format]
+    response = StreamingHttpResponse(
+        renderer(shopping_list_rows(request.user)),
+        content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shopping_list.{export_format}"')
+    return response
+
+
+def content_hash(rows):
+    payload = json.dumps([PDF_TEMPLATE_VERSION, rows], ensure_ascii=False)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def render_pdf(rows):
+    buffer = io.BytesIO()
+    content = [SHOPPING_LIST_HEADER]
+    content.extend(rows)
 
     doc = SimpleDocTemplate(buffer)
     t = Table(content)
@@ -41,6 +152,23 @@ def pdf_maker(request):
 
     t.setStyle(list_style)
     doc.build([t])
+    return buffer.getvalue()
+
+
+def pdf_maker(request):
+    rows = list(shopping_list_rows(request.user))
+    digest = content_hash(rows)
+    etag = quote_etag(digest)
 
-    buffer.seek(0)
-    return FileResponse(buffer, as_attachment=True, filename='hello.pdf')
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        response = HttpResponseNotModified()
+    else:
+        pdf = pdf_cache.get(digest)
+        if pdf is None:
+            pdf = render_pdf(rows)
+            pdf_cache.set(digest, pdf)
+        response = FileResponse(io.BytesIO(pdf), as_attachment=True,
+                                filename='hello.pdf')
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
@@ -1,68 +1,105 @@
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.shortcuts import get_object_or_404
 from django.http import Http404
+from django.db import transaction
 from django.db.models import OuterRef, Exists
 from rest_framework import (viewsets,
-                            permissions,
                             filters,
+                            permissions,
                             response,
                             status,
                             exceptions)
 from rest_framework.decorators import action
+from rest_framework.parsers import JSONParser
 from rest_framework.response import Response
 from rest_framework.request import Request
+from django import forms
 from django_filters import (rest_framework as rest_filters,
                             FilterSet, TypedChoiceFilter,
-                            ModelMultipleChoiceFilter)
+                            ChoiceFilter, Filter)
 from distutils.util import strtobool
 from djoser.views import UserViewSet
 from users.models import Follow
 from foodgram_project import pagination
+from foodgram_project.db import insert_ignore
+from recipes import counters, feed, shopping_list, trending, versions
 from recipes.models import (Tag, Ingredient, Recipe,
                             Favorite,
-                            Cart)
+                            Cart, FeedInboxEntry)
 from .serializers import (TagSerializer, IngredientSerializer,
                           RecipeReadSerializer, RecipeWriteSerializer,
                           RecipeMinifiedSerializer,
                           UserSubscribeSerializer
                           )
 from .permissions import IsOwnerOrReadOnly
-from .utils import pdf_maker
+from .relations import RelationsMixin
+from .querysets import recipes_for_read, subscriptions_for_read
+from .search import get_search_params, search_ingredients
+from . import ingredient_index
+from .caching import VersionedCacheMixin
+from .negotiation import IgnoreFormatParamNegotiation
+from .parsers import MultiPartJSONParser
+from .utils import (pdf_maker, stream_shopping_list,
+                    SHOPPING_LIST_FORMATS)
 
 User = get_user_model()
 
 # Create your views here.
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(VersionedCacheMixin, viewsets.ReadOnlyModelViewSet):
 
+    cache_version_name = versions.TAGS
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(VersionedCacheMixin,
+                        viewsets.ReadOnlyModelViewSet):
 
+    cache_version_name = versions.INGREDIENTS
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [permissions.AllowAny]
     pagination_class = None
-    filter_backends = [filters.SearchFilter]
-    search_fields = ['^name']
+
+    def list(self, request, *args, **kwargs):
+        term, limit = get_search_params(request)
+        if settings.INGREDIENT_SEARCH_BACKEND == 'memory':
+            return Response(ingredient_index.get_index().search(term, limit))
+        serializer = self.get_serializer(
+            search_ingredients(term, limit, self.get_queryset()), many=True)
+        return Response(serializer.data)
 
 
 BOOLEAN_CHOICES = (('0', 'False'), ('1', 'True'),)
 
 
+class TagSlugsField(forms.Field):
+    '''Repeated ?tags= parameter as a list of slugs.'''
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or [] if slug]
+
+
+class TagSlugsFilter(Filter):
+    field_class = TagSlugsField
+
+
+TAGS_MODE_CHOICES = (('any', 'any'), ('all', 'all'),)
+
+
 class RecipeFilter(FilterSet):
-    tags = ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        to_field_name='slug',
-        queryset=Tag.objects.all(),
-        # conjoined=True
-    )
+    tags = TagSlugsFilter(method='filter_tags')
+    # any: recipes with at least one of the tags, all: with every tag
+    tags_mode = ChoiceFilter(choices=TAGS_MODE_CHOICES,
+                             method='filter_tags_mode')
 
     is_in_shopping_cart = TypedChoiceFilter(choices=BOOLEAN_CHOICES,
                                             coerce=strtobool,
@@ -73,6 +110,21 @@ class RecipeFilter(FilterSet):
                                      method='filter_is_favorited'
                                      )
 
+    def filter_tags(self, queryset, name, value):
+        # slugs are matched in the subquery, not resolved to ids first
+        recipe_tags = Recipe.tags.through.objects.filter(
+            recipe_id=OuterRef('pk'))
+        if self.form.cleaned_data.get('tags_mode') == 'all':
+            for slug in set(value):
+                queryset = queryset.filter(
+                    Exists(recipe_tags.filter(tag__slug=slug)))
+            return queryset
+        return queryset.filter(Exists(recipe_tags.filter(tag__slug__in=value)))
+
+    def filter_tags_mode(self, queryset, name, value):
+        # applied by filter_tags
+        return queryset
+
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if value == 0:
             return queryset
@@ -89,25 +141,48 @@ class RecipeFilter(FilterSet):
 
     class Meta:
         model = Recipe
-        fields = ['author', 'tags', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['author', 'tags', 'tags_mode', 'is_favorited',
+                  'is_in_shopping_cart']
+
+
+class RecipeOrderingFilter(filters.OrderingFilter):
+    '''
+    ?ordering=-favorites_count and the like; recipes with equal values
+    keep the feed order, so pages do not overlap. Cursor pagination
+    always uses the feed order.
+    '''
 
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        return [*ordering, '-pub_date', '-id']
 
-class RecipeViewSet(viewsets.ModelViewSet):
 
-    queryset = Recipe.objects.all().select_related()
+class RecipeViewSet(RelationsMixin, viewsets.ModelViewSet):
+
+    queryset = Recipe.objects.all()
     permission_classes = [
         permissions.IsAuthenticatedOrReadOnly & IsOwnerOrReadOnly]
-    filter_backends = (rest_filters.DjangoFilterBackend,)
+    filter_backends = (rest_filters.DjangoFilterBackend,
+                       RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count')
+    pagination_class = pagination.RecipePagination
+    # multipart lets clients upload the image as a file instead of base64
+    parser_classes = (JSONParser, MultiPartJSONParser)
+
+    def get_queryset(self):
+        return recipes_for_read(self.request.user, super().get_queryset())
 
     def get_serializer_class(self):
-        if self.action in ['list', 'retrieve']:
+        if self.action in ['list', 'retrieve', 'trending', 'feed']:
             return RecipeReadSerializer
         if self.action in ['create', 'partial_update']:
             return RecipeWriteSerializer
         raise NotImplementedError(
             'RecipeViewSet works only with actions list, retrieve, create, '
-            'partial update')
+            'partial update, trending, feed')
 
     def create(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
@@ -116,7 +191,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         instance = self.perform_create(serializer)
 
         resp_serializer = RecipeReadSerializer(
-            instance, context=serializer.context)
+            self.get_queryset().get(pk=instance.pk),
+            context=serializer.context)
         headers = self.get_success_headers(resp_serializer.data)
 
         return response.Response(resp_serializer.data,
@@ -127,6 +203,12 @@ class RecipeViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         return serializer.save()
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        # shopping lists are updated by a pre_delete receiver
+        instance.delete()
+        counters.recipes_changed(instance.author_id, -1)
+
     def update(self, request, *args, **kwargs):
         return response.Response("Method PUT not allowed, try PATCH",
                                  status=status.HTTP_405_METHOD_NOT_ALLOWED
@@ -142,7 +224,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         instance = self.perform_create(serializer)
 
         resp_serializer = RecipeReadSerializer(
-            instance, context=serializer.context)
+            self.get_queryset().get(pk=instance.pk),
+            context=serializer.context)
         headers = self.get_success_headers(resp_serializer.data)
         return response.Response(resp_serializer.data,
                                  status=status.HTTP_200_OK,
@@ -150,32 +233,38 @@ class RecipeViewSet(viewsets.ModelViewSet):
                                  )
 
     def add_obj(self, model, user, pk):
-        if model.objects.filter(user=user, recipe__id=pk).exists():
-            return Response({
-                'errors':
-                f'Рецепт уже добавлен в список {model._meta.verbose_name}'
-            }, status=status.HTTP_400_BAD_REQUEST)
-        try:
-            recipe = get_object_or_404(Recipe, id=pk)
-        except Http404:
+        recipe = Recipe.objects.filter(id=pk).first()
+        if recipe is None:
             return response.Response({
                 "errors": f"Рецепт с id = {pk} не найден"},
                 status=status.HTTP_400_BAD_REQUEST)
-        model.objects.create(user=user, recipe=recipe)
+        with transaction.atomic():
+            # a single INSERT decides whether the recipe was added, so
+            # concurrent requests cannot add it twice or fail
+            if not insert_ignore(model, user=user, recipe=recipe):
+                return Response({
+                    'errors': 'Рецепт уже добавлен в список '
+                    f'{model._meta.verbose_name}'
+                }, status=status.HTTP_400_BAD_REQUEST)
+            counters.recipe_list_changed(model, recipe.id, 1)
+            if model is Cart:
+                shopping_list.add_recipe(user, recipe.id)
         serializer = RecipeMinifiedSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def delete_obj(self, model, user, pk):
-        try:
-            recipe = get_object_or_404(Recipe, id=pk)
-        except Http404:
+        with transaction.atomic():
+            deleted, _ = model.objects.filter(user=user,
+                                              recipe_id=pk).delete()
+            if deleted:
+                counters.recipe_list_changed(model, pk, -1)
+                if model is Cart:
+                    shopping_list.remove_recipe(user, pk)
+                return Response(status=status.HTTP_204_NO_CONTENT)
+        if not Recipe.objects.filter(id=pk).exists():
             return response.Response({
                 "errors": f"Рецепт с id = {pk} не найден"},
                 status=status.HTTP_400_BAD_REQUEST)
-        obj = model.objects.filter(user=user, recipe=recipe)
-        if obj.exists():
-            obj.delete()
-            return Response(status=status.HTTP_204_NO_CONTENT)
         return Response({
             'errors': f'Рецепт уже удален из списка {model._meta.verbose_name}'
         }, status=status.HTTP_400_BAD_REQUEST)
@@ -198,12 +287,89 @@ class RecipeViewSet(viewsets.ModelViewSet):
             return self.delete_obj(Cart, request.user, pk)
         return None
 
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            pagination_class=pagination.FeedPagination)
+    def feed(self, request):
+        '''
+        Recipes of followed authors, newest first, paginated by cursor.
+        '''
+        user = request.user
+        if not feed.uses_inbox(user.following_count):
+            page = self.paginate_queryset(
+                recipes_for_read(user, feed.followed_recipes(user)))
+        else:
+            self.paginator.keyset_fields = ('pub_date', 'recipe_id')
+            entries = self.paginate_queryset(
+                FeedInboxEntry.objects.filter(user=user))
+            ids = [entry.recipe_id for entry in entries]
+            recipes = recipes_for_read(user).in_bulk(ids)
+            page = [recipes[pk] for pk in ids if pk in recipes]
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
+
     @action(detail=False, methods=['get'])
+    def trending(self, request):
+        '''
+        Most popular recent recipes, overall or with ?tag=<slug>, read
+        from the ranking precomputed by the refresh-trending command.
+        '''
+        tag_id = None
+        if 'tag' in request.query_params:
+            tag_id = Tag.objects.filter(
+                slug=request.query_params['tag']).values_list(
+                'pk', flat=True).first()
+            if tag_id is None:
+                raise exceptions.NotFound('Тег не найден')
+        try:
+            limit = int(request.query_params.get(
+                'limit', pagination.CustomPagination.page_size))
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            raise exceptions.ValidationError({
+                'limit': ['Ожидается положительное целое число']})
+        ids = trending.ranked_ids(tag_id)[:limit]
+        recipes = recipes_for_read(request.user).in_bulk(ids)
+        serializer = self.get_serializer(
+            [recipes[pk] for pk in ids if pk in recipes], many=True)
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[permissions.IsAuthenticated],
+            content_negotiation_class=IgnoreFormatParamNegotiation)
     def download_shopping_cart(self, request, *args, **kwargs):
-        return pdf_maker(request=request)
-
-
-class CustomUserViewSet(UserViewSet):
+        export_format = request.query_params.get('format', 'pdf')
+        if export_format not in SHOPPING_LIST_FORMATS:
+            raise exceptions.ValidationError({
+                'format': ['Доступные форматы: '
+                           f'{", ".join(SHOPPING_LIST_FORMATS)}']})
+        if export_format == 'pdf':
+            return pdf_maker(request=request)
+        return stream_shopping_list(request, export_format)
+
+
+class CustomUserViewSet(RelationsMixin, UserViewSet):
+
+    def get_recipes_limit(self):
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit is None:
+            return None
+        try:
+            recipes_limit = int(recipes_limit)
+        except ValueError:
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise exceptions.ValidationError({
+                'recipes_limit': ['Ожидается неотрицательное целое число']})
+        return recipes_limit
+
+    def follows_changed(self, author, delta):
+        user = self.request.user
+        counters.followers_changed(author.pk, delta)
+        counters.following_changed(user.pk, delta)
+        user.refresh_from_db(fields=['following_count'])
+        feed.follows_changed(user, author.pk, followed=delta > 0)
 
     @action(
         detail=True,
@@ -218,35 +384,39 @@ class CustomUserViewSet(UserViewSet):
             raise exceptions.NotFound(
                 f"Пользователь с id = {id} не найден")
 
-        if request.user.pk == id:
+        if request.user.pk == user_to_subscribe.pk:
             return Response({
                 "errors": f"Ваш id = {request.user.pk}, подписка на себя "
                 "запрещена."},
                 status=status.HTTP_400_BAD_REQUEST)
 
         if request.method == 'POST':
-            if Follow.objects.filter(user=request.user,
-                                     author=user_to_subscribe).exists():
-                return Response({
-                    "errors": f"Вы уже подписаны на пользователя с id = {id}"},
-                    status=status.HTTP_400_BAD_REQUEST)
-            Follow.objects.create(user=request.user,
-                                  author=user_to_subscribe)
+            with transaction.atomic():
+                if not insert_ignore(Follow, user=request.user,
+                                     author=user_to_subscribe):
+                    return Response({
+                        "errors":
+                        f"Вы уже подписаны на пользователя с id = {id}"},
+                        status=status.HTTP_400_BAD_REQUEST)
+                self.follows_changed(user_to_subscribe, 1)
             serializer = UserSubscribeSerializer(
-                user_to_subscribe, context={'request': request})
+                subscriptions_for_read(
+                    request.user, self.get_recipes_limit()
+                ).get(pk=user_to_subscribe.pk),
+                context={'request': request})
             return Response(serializer.data, status=status.HTTP_200_OK)
 
         if request.method == 'DELETE':
-            try:
-                follow = get_object_or_404(Follow,
-                                           user=request.user,
-                                           author=user_to_subscribe)
-            except Http404:
-                return Response({
-                    "errors": f'Вы не подписаны на пользователя с id={id}, '
-                    ' вы не можете отписаться от него'},
-                    status=status.HTTP_400_BAD_REQUEST)
-            follow.delete()
+            with transaction.atomic():
+                deleted, _ = Follow.objects.filter(
+                    user=request.user, author=user_to_subscribe).delete()
+                if not deleted:
+                    return Response({
+                        "errors":
+                        f'Вы не подписаны на пользователя с id={id}, '
+                        ' вы не можете отписаться от него'},
+                        status=status.HTTP_400_BAD_REQUEST)
+                self.follows_changed(user_to_subscribe, -1)
             return Response(status=status.HTTP_204_NO_CONTENT)
 
         raise NotImplementedError(
@@ -258,7 +428,8 @@ class CustomUserViewSet(UserViewSet):
         pagination_class=pagination.CustomPagination
     )
     def subscriptions(self, request):
-        queryset = request.user.follow.all()
+        queryset = subscriptions_for_read(request.user,
+                                          self.get_recipes_limit())
         page = self.paginate_queryset(queryset)
         if page is not None:
             serializer = UserSubscribeSerializer(
@@ -0,0 +1,76 @@
+from contextlib import contextmanager
+
+from django.db import connections, router
+
+
+def insert_ignore(model, **values):
+    '''
+    INSERT a row, doing nothing if it violates a unique constraint.
+    Return True if the row was inserted.
+
+    Unlike exists() followed by create(), this is one statement and
+    concurrent inserts of the same row cannot fail with IntegrityError.
+    Supported by PostgreSQL and SQLite.
+    '''
+    obj = model(**values)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [field for field in model._meta.concrete_fields
+              if not field.primary_key or field.attname in values]
+    columns = [quote(field.column) for field in fields]
+    params = [field.get_db_prep_save(field.pre_save(obj, add=True),
+                                     connection)
+              for field in fields]
+    sql = (f'INSERT INTO {quote(model._meta.db_table)} '
+           f'({", ".join(columns)}) '
+           f'VALUES ({", ".join(["%s"] * len(columns))}) '
+           'ON CONFLICT DO NOTHING')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount == 1
+
+
+@contextmanager
+def without_auto_now(model, field_name):
+    '''Let bulk_create() keep explicit values of an auto_now_add field.'''
+    field = model._meta.get_field(field_name)
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def insert_many(model, field_names, rows, batch_size=5000):
+    '''
+    INSERT rows given as tuples of values of field_names, several rows
+    per statement. Much cheaper than bulk_create() for large numbers of
+    rows whose model instances are not needed.
+    '''
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    fields = [model._meta.get_field(name) for name in field_names]
+    columns = ', '.join(quote(field.column) for field in fields)
+    # ints and strings are passed as is, other values need preparing
+    prepared = [index for index, field in enumerate(fields)
+                if field.get_internal_type() not in (
+                    'ForeignKey', 'IntegerField', 'BigIntegerField',
+                    'PositiveIntegerField', 'PositiveSmallIntegerField',
+                    'CharField', 'TextField')]
+    per_query = max(1, min(batch_size, connection.ops.bulk_batch_size(
+        fields, rows)))
+    placeholders = f'({", ".join(["%s"] * len(fields))})'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), per_query):
+            chunk = rows[start:start + per_query]
+            params = []
+            for row in chunk:
+                row = list(row)
+                for index in prepared:
+                    row[index] = fields[index].get_db_prep_save(
+                        row[index], connection)
+                params.extend(row)
+            cursor.execute(
+                f'INSERT INTO {quote(model._meta.db_table)} ({columns}) '
+                f'VALUES {", ".join([placeholders] * len(chunk))}',
+                params)
@@ -1,5 +1,157 @@
+import base64
+from datetime import datetime
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
 
 
 class CustomPagination(pagination.PageNumberPagination):
     page_size = 9
+
+
+class CappedCountPaginator(Paginator):
+    '''
+    Paginator which stops counting recipes at RECIPE_PAGINATION_MAX_COUNT,
+    so COUNT(*) never scans more rows than that.
+    '''
+
+    @cached_property
+    def count(self):
+        return self.object_list[
+            :settings.RECIPE_PAGINATION_MAX_COUNT].count()
+
+
+def encode_cursor(pub_date, pk):
+    value = f'{pub_date.isoformat()}|{pk}'
+    return base64.urlsafe_b64encode(value.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        pub_date, pk = base64.urlsafe_b64decode(
+            cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(pub_date), int(pk)
+    except (TypeError, ValueError, UnicodeError):
+        raise NotFound('Неверный курсор')
+
+
+class RecipePagination(CustomPagination):
+    '''
+    Page number pagination of the recipe feed with opt-in modes for deep
+    pages:
+
+    - ?cursor= switches to keyset pagination over (pub_date, id), newest
+      first; an empty cursor means the first page. Pages are located by
+      the composite index instead of OFFSET and no COUNT(*) is run.
+    - ?count=0 keeps page numbers but skips COUNT(*), "count" is null.
+    - ?count=capped stops counting at RECIPE_PAGINATION_MAX_COUNT, so
+      pages past the cap are not reachable.
+
+    The default mode counts exactly.
+    '''
+
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    # (datetime, integer) fields of the keyset, both descending
+    keyset_fields = ('pub_date', 'id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = 'page'
+        if self.cursor_query_param in request.query_params:
+            self.mode = 'cursor'
+            return self.paginate_by_cursor(queryset, request)
+        count = request.query_params.get(self.count_query_param)
+        if count in ('0', 'false'):
+            self.mode = 'uncounted'
+            return self.paginate_without_count(queryset, request)
+        if count == 'capped':
+            self.django_paginator_class = CappedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_by_cursor(self, queryset, request):
+        date_field, id_field = self.keyset_fields
+        queryset = queryset.order_by(f'-{date_field}', f'-{id_field}')
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            pub_date, pk = decode_cursor(cursor)
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__lt': pub_date})
+                | Q(**{f'{id_field}__lt': pk}),
+                **{f'{date_field}__lte': pub_date})
+        page = list(queryset[:self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        page = page[:self.page_size]
+        self.next_cursor = None
+        if self.has_next:
+            self.next_cursor = encode_cursor(getattr(page[-1], date_field),
+                                             getattr(page[-1], id_field))
+        return page
+
+    def paginate_without_count(self, queryset, request):
+        try:
+            self.page_number = int(
+                request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            self.page_number = 0
+        if self.page_number < 1:
+            raise NotFound('Неверная страница')
+        offset = (self.page_number - 1) * self.page_size
+        page = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(page) > self.page_size
+        return page[:self.page_size]
+
+    def get_next_link(self):
+        url = self.request.build_absolute_uri()
+        if self.mode == 'cursor':
+            if not self.has_next:
+                return None
+            return replace_query_param(url, self.cursor_query_param,
+                                       self.next_cursor)
+        if self.mode == 'uncounted':
+            if not self.has_next:
+                return None
+            return replace_query_param(url, self.page_query_param,
+                                       self.page_number + 1)
+        return super().get_next_link()
+
+    def get_previous_link(self):
+        if self.mode == 'cursor':
+            return None
+        if self.mode == 'uncounted':
+            url = self.request.build_absolute_uri()
+            if self.page_number == 1:
+                return None
+            if self.page_number == 2:
+                return remove_query_param(url, self.page_query_param)
+            return replace_query_param(url, self.page_query_param,
+                                       self.page_number - 1)
+        return super().get_previous_link()
+
+    def get_paginated_response(self, data):
+        if self.mode == 'page':
+            return super().get_paginated_response(data)
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(RecipePagination):
+    '''
+    Keyset pagination only: the first page is requested without
+    ?cursor=, next pages by the cursor from "next".
+    '''
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.mode = 'cursor'
+        return self.paginate_by_cursor(queryset, request)
@@ -10,7 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.1/ref/settings/
 """
 import os
-
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -47,6 +47,7 @@ INSTALLED_APPS = [
     'djoser',
     'users',
     'recipes.apps.RecipesConfig',
+    'api.apps.ApiConfig',
     'django_filters',
 ]
 
@@ -117,6 +118,29 @@ DATABASES = {
 }
 
 
+# Cache
+# locmem by default; to share the cache between gunicorn workers use e.g.
+# CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache
+# CACHE_LOCATION=/var/tmp/foodgram_cache
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('CACHE_MAX_ENTRIES', default=10000)),
+        },
+    },
+}
+
+# Seconds a tags/ingredients response stays in the server cache, and
+# max-age sent to nginx and browsers for them
+REFERENCE_DATA_CACHE_TIMEOUT = 60 * 60
+REFERENCE_DATA_MAX_AGE = 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
 
@@ -174,6 +198,52 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend']
 }
 
+# Serializers load at most this many ids of a user's follows, favorites
+# or cart at once, larger sets are queried for each page (api.relations)
+RELATION_SET_LIMIT = 1000
+
+# Recipe list requested with ?count=capped stops counting at this number
+# of recipes, deeper pages are available with ?cursor= pagination
+RECIPE_PAGINATION_MAX_COUNT = 10000
+
+# Upper bound in bytes for rendered shopping list PDFs kept in memory
+SHOPPING_LIST_PDF_CACHE_SIZE = 32 * 1024 * 1024
+
+# Default and maximum number of ingredients returned by the search
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_MAX_LIMIT = 100
+# 'memory' answers from the per-process index (api.ingredient_index),
+# 'database' runs the indexed queries of api.search
+INGREDIENT_SEARCH_BACKEND = os.getenv('INGREDIENT_SEARCH_BACKEND',
+                                      default='memory')
+
+# Widths of recipe image renditions generated by recipes.images
+RECIPE_IMAGE_RENDITIONS = {
+    'thumbnail': 240,
+    'card': 640,
+    'full': 1280,
+}
+RECIPE_IMAGE_QUALITY = 80
+# Uploads with a longer side are rejected
+RECIPE_IMAGE_MAX_SIDE = 6000
+# Maximum size of an uploaded image in bytes, checked before decoding;
+# keep client_max_body_size in infra/nginx.conf above 4/3 of it
+RECIPE_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+# Threads generating renditions per process, 0 generates them inline
+RECIPE_IMAGE_WORKERS = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+# Trending recipes, see recipes.trending: the weight of a favorite or
+# cart addition halves every TRENDING_HALF_LIFE, additions older than
+# TRENDING_WINDOW are ignored, TRENDING_TOP_N recipes are ranked per tag
+TRENDING_HALF_LIFE = timedelta(days=3)
+TRENDING_WINDOW = timedelta(days=30)
+TRENDING_TOP_N = 50
+
+# Users following more authors than this get a materialized feed inbox
+# (see recipes.feed), None disables inboxes; after a change run
+# manage.py rebuild-feed-inboxes
+FEED_INBOX_THRESHOLD = 300
+
 DJOSER = {
     'SERIALIZERS': {
         'user_create': 'users.serializers.UserManageSerializer',
@@ -14,3 +14,16 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram_project.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings  # noqa: E402
+
+if settings.INGREDIENT_SEARCH_BACKEND == 'memory':
+    from django.db import DatabaseError  # noqa: E402
+
+    from api.ingredient_index import warm_up  # noqa: E402
+
+    try:
+        warm_up()
+    except DatabaseError:
+        # database is not ready yet, the index is built on first search
+        pass
@@ -1,7 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 
-from .models import Tag, Recipe, Ingredient
+from . import shopping_list
+from .models import Cart, Tag, Recipe, Ingredient, IngredientRecipe
 from users.admin import UserAdmin
 
 
@@ -24,13 +25,18 @@ class UserAdminWithRecipes(UserAdmin):
     save_on_top = True
     inlines = (FavoriteInlineAdmin, CartInlineAdmin)
 
+    def save_formset(self, request, form, formset, change):
+        super().save_formset(request, form, formset, change)
+        if formset.model is Cart:
+            shopping_list.rebuild([form.instance.pk])
+
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('name', 'author')
+    list_display = ('name', 'author', 'favorites_count')
     list_filter = ['name', 'author', 'tags']
     search_fields = ['name', 'author', 'tags']
-    readonly_fields = ('count_users_loved_recipe',)
-    fields = ('count_users_loved_recipe', 'name',
+    readonly_fields = ('favorites_count',)
+    fields = ('favorites_count', 'name',
               'author', 'image', 'text',
               'cooking_time',
               'tags',
@@ -41,6 +47,15 @@ class RecipeAdmin(admin.ModelAdmin):
     def has_add_permission(self, request, obj=None):
         return False
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not IngredientRecipe:
+            return super().save_formset(request, form, formset, change)
+        recipe_id = form.instance.pk
+        old_amounts = shopping_list.recipe_amounts(recipe_id)
+        super().save_formset(request, form, formset, change)
+        shopping_list.change_recipe(recipe_id, old_amounts,
+                                    shopping_list.recipe_amounts(recipe_id))
+
 
 class IngredientAdmin(admin.ModelAdmin):
     list_display = ('name', 'measurement_unit')
@@ -0,0 +1,82 @@
+'''
+Denormalized popularity counters.
+
+Recipe.favorites_count and Recipe.cart_count, ProfileUser.recipes_count,
+followers_count and following_count are adjusted with F() updates in the
+same transaction as the row they count, so concurrent requests do not
+lose increments. Rows removed by cascades or edited in the admin are
+not tracked; recount() repairs such drift.
+'''
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from users.models import Follow
+
+from .models import Cart, Favorite, Recipe
+
+User = get_user_model()
+
+RECIPE_LIST_COUNTERS = {
+    Favorite: 'favorites_count',
+    Cart: 'cart_count',
+}
+
+
+def change(queryset, field, delta):
+    # a drifted counter must not make the update fail
+    queryset.update(**{field: Greatest(F(field) + delta, 0)})
+
+
+def recipe_list_changed(model, recipe_id, delta):
+    '''A recipe was added to (delta=1) or removed from a user list.'''
+    change(Recipe.objects.filter(pk=recipe_id),
+           RECIPE_LIST_COUNTERS[model], delta)
+
+
+def followers_changed(author_id, delta):
+    change(User.objects.filter(pk=author_id), 'followers_count', delta)
+
+
+def following_changed(user_id, delta):
+    change(User.objects.filter(pk=user_id), 'following_count', delta)
+
+
+def recipes_changed(author_id, delta):
+    change(User.objects.filter(pk=author_id), 'recipes_count', delta)
+
+
+def count_of(model, field):
+    '''Number of model rows with field pointing to the outer row.'''
+    return Coalesce(Subquery(
+        model.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(count=Count('pk')).values('count')), 0)
+
+
+def counters():
+    '''(model, counter field, actual value expression) of all counters.'''
+    return [
+        (Recipe, 'favorites_count', count_of(Favorite, 'recipe')),
+        (Recipe, 'cart_count', count_of(Cart, 'recipe')),
+        (User, 'recipes_count', count_of(Recipe, 'author')),
+        (User, 'followers_count', count_of(Follow, 'author')),
+        (User, 'following_count', count_of(Follow, 'user')),
+    ]
+
+
+def recount(fix=True):
+    '''
+    Compare stored counters with the actual numbers of rows and, with
+    fix, correct them. Return {counter: number of drifted rows}.
+    '''
+    drift = {}
+    for model, field, actual in counters():
+        drifted = model.objects.annotate(actual=actual).exclude(
+            **{field: F('actual')}).values('pk')
+        label = f'{model._meta.model_name}.{field}'
+        if fix:
+            drift[label] = model.objects.filter(pk__in=drifted).update(
+                **{field: actual})
+        else:
+            drift[label] = drifted.count()
+    return drift
@@ -0,0 +1,86 @@
+'''
+Feed of recipes from the authors a user follows.
+
+For most users the feed is read directly from the recipes table: recipes
+with author_id IN (authors the user follows), newest first, located by
+the (pub_date, id) and (author, pub_date, id) indexes.
+
+That plan gets slow for users following many authors, so users who
+follow more than FEED_INBOX_THRESHOLD authors get a materialized inbox
+instead: FeedInboxEntry rows written when a followed author publishes a
+recipe and read with the (user, pub_date, recipe) index. Inboxes are
+built when a user crosses the threshold and dropped when they fall
+below it. After changing the threshold run rebuild-feed-inboxes.
+'''
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Subquery
+
+from users.models import Follow
+
+from .models import FeedInboxEntry, Recipe
+
+User = get_user_model()
+BATCH_SIZE = 1000
+
+
+def uses_inbox(following_count):
+    threshold = settings.FEED_INBOX_THRESHOLD
+    return threshold is not None and following_count > threshold
+
+
+def followed_recipes(user):
+    '''Recipes of authors followed by user, fan-out on read.'''
+    return Recipe.objects.filter(author_id__in=Subquery(
+        Follow.objects.filter(user=user).values('author_id')))
+
+
+def add_entries(user_id, recipes):
+    FeedInboxEntry.objects.bulk_create(
+        (FeedInboxEntry(user_id=user_id, recipe_id=pk, author_id=author_id,
+                        pub_date=pub_date)
+         for pk, author_id, pub_date in recipes.values_list(
+             'pk', 'author_id', 'pub_date').iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def rebuild(user):
+    '''Build the inbox of user from scratch, or drop it.'''
+    FeedInboxEntry.objects.filter(user=user).delete()
+    if uses_inbox(user.following_count):
+        add_entries(user.pk, followed_recipes(user))
+
+
+def recipe_published(recipe):
+    '''Put a new recipe into inboxes of the author's followers.'''
+    threshold = settings.FEED_INBOX_THRESHOLD
+    if threshold is None:
+        return
+    followers = Follow.objects.filter(
+        author_id=recipe.author_id,
+        user__following_count__gt=threshold).values_list(
+        'user_id', flat=True)
+    FeedInboxEntry.objects.bulk_create(
+        (FeedInboxEntry(user_id=user_id, recipe=recipe,
+                        author_id=recipe.author_id,
+                        pub_date=recipe.pub_date)
+         for user_id in followers.iterator()),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def follows_changed(user, author_id, followed):
+    '''
+    Update the inbox of user after the user followed (followed=True) or
+    unfollowed an author. user.following_count must be current.
+    '''
+    count = user.following_count
+    was_using = uses_inbox(count - 1 if followed else count + 1)
+    if uses_inbox(count) != was_using:
+        rebuild(user)
+    elif not was_using:
+        return
+    elif followed:
+        add_entries(user.pk, Recipe.objects.filter(author_id=author_id))
+    else:
+        FeedInboxEntry.objects.filter(user=user,
+                                      author_id=author_id).delete()
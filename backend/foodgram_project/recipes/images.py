@@ -0,0 +1,194 @@
+'''
+Processing of recipe images.
+
+Uploaded images are normalized before they are stored: orientation from
+EXIF is applied, metadata is dropped and the image is saved as JPEG
+under a name derived from the content hash, so the same picture
+uploaded twice is stored once and files never change under their URL
+(nginx may cache them forever).
+
+Smaller renditions for lists and previews are generated after the
+recipe is committed, on a pool of worker threads, and recorded in
+Recipe.renditions. Until they are ready the original is served.
+'''
+import hashlib
+import io
+import logging
+import os
+import posixpath
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_TO = 'recipes/images'
+ORIGINAL_QUALITY = 90
+# Pillow format name and file extension of rendition formats
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+
+
+class ImageValidationError(ValueError):
+    pass
+
+
+def to_rgb(image):
+    '''Flatten transparency onto white, renditions are opaque.'''
+    if image.mode in ('RGBA', 'LA', 'P'):
+        image = image.convert('RGBA')
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image, mask=image.getchannel('A'))
+        return background
+    return image.convert('RGB')
+
+
+def normalize(file):
+    '''
+    Validate an uploaded image file and return (name, JPEG bytes) of the
+    original to store: upright, without metadata, named by content hash.
+    '''
+    try:
+        image = Image.open(file)
+        width, height = image.size
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_SIDE:
+            raise ImageValidationError(
+                'Изображение должно быть не больше '
+                f'{settings.RECIPE_IMAGE_MAX_SIDE} пикселей по каждой '
+                'стороне')
+        image = to_rgb(ImageOps.exif_transpose(image))
+    except (OSError, Image.DecompressionBombError):
+        raise ImageValidationError('Не удалось прочитать изображение')
+    buffer = io.BytesIO()
+    # no exif= or icc_profile= arguments, so metadata is not copied
+    image.save(buffer, 'JPEG', quality=ORIGINAL_QUALITY, optimize=True)
+    content = buffer.getvalue()
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    return posixpath.join(UPLOAD_TO, f'{digest}.jpg'), content
+
+
+def store(file):
+    '''
+    Save a file returned by normalize() unless the same image is stored
+    already, return its storage name.
+    '''
+    if default_storage.exists(file.name):
+        try:
+            # fresh mtime keeps collect-orphan-images off a file which
+            # was an orphan until now
+            os.utime(default_storage.path(file.name))
+        except NotImplementedError:
+            pass
+        return file.name
+    return default_storage.save(file.name, file)
+
+
+def rendition_name(name, rendition, extension):
+    stem = posixpath.splitext(name)[0]
+    return f'{stem}/{rendition}.{extension}'
+
+
+def make_renditions(name):
+    '''
+    Generate every rendition of a stored image in every format and
+    return the description to keep in Recipe.renditions:
+    {'source': name, '<rendition>': {'width': .., 'height': ..,
+    '<format>': storage name, ...}, ...}
+    '''
+    with default_storage.open(name) as source:
+        original = to_rgb(ImageOps.exif_transpose(Image.open(source)))
+    renditions = {'source': name}
+    for rendition, width in settings.RECIPE_IMAGE_RENDITIONS.items():
+        image = original.copy()
+        # never upscales, keeps the aspect ratio
+        image.thumbnail((width, width * 4), Image.Resampling.LANCZOS)
+        files = {'width': image.width, 'height': image.height}
+        for extension, image_format in FORMATS.items():
+            file_name = rendition_name(name, rendition, extension)
+            if not default_storage.exists(file_name):
+                buffer = io.BytesIO()
+                image.save(buffer, image_format,
+                           quality=settings.RECIPE_IMAGE_QUALITY)
+                file_name = default_storage.save(
+                    file_name, ContentFile(buffer.getvalue()))
+            files[extension] = file_name
+        renditions[rendition] = files
+    return renditions
+
+
+def process_recipe_image(recipe_id, name):
+    try:
+        renditions = make_renditions(name)
+    except Exception:
+        logger.exception('Could not make renditions of %s', name)
+        return
+    # the image may have been replaced while we were working
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        renditions=renditions)
+
+
+def run_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        close_old_connections()
+
+
+def rendition_files(renditions):
+    '''Storage names of all files listed in Recipe.renditions.'''
+    for rendition, files in renditions.items():
+        if rendition == 'source':
+            continue
+        for extension in FORMATS:
+            if extension in files:
+                yield files[extension]
+
+
+def discard(name, renditions):
+    '''
+    Once the current transaction commits, delete an image which is no
+    longer used by any recipe together with its renditions. Identical
+    uploads share one file, so it may still belong to another recipe.
+    '''
+    def delete():
+        if Recipe.objects.filter(image=name).exists():
+            return
+        for file_name in [name, *rendition_files(renditions)]:
+            default_storage.delete(file_name)
+
+    if name:
+        transaction.on_commit(delete)
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images')
+    return _executor
+
+
+def schedule_renditions(recipe):
+    '''
+    Generate renditions of the recipe image once the current transaction
+    commits. With RECIPE_IMAGE_WORKERS = 0 they are generated in the
+    calling thread.
+    '''
+    recipe_id, name = recipe.pk, recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(run_in_worker, recipe_id, name)
+        else:
+            process_recipe_image(recipe_id, name)
+
+    transaction.on_commit(submit)
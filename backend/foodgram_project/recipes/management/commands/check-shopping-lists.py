@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = ('Compare materialized shopping lists with carts and report '
+            'rows which drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='user_ids',
+                            help='check only the list of this user id '
+                                 '(can be repeated)')
+        parser.add_argument('--fix', action='store_true',
+                            help='rebuild lists of users with mismatches')
+
+    def handle(self, *args, **options):
+        mismatches = shopping_list.find_inconsistencies(options['user_ids'])
+        for user_id, ingredient_id, expected, stored in mismatches:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id} '
+                f'expected={expected} stored={stored}')
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS(
+                'SUCCESS: shopping lists are consistent'))
+            return
+        if options['fix']:
+            shopping_list.rebuild(
+                sorted({user_id for user_id, *_ in mismatches}))
+            self.stdout.write(self.style.SUCCESS(
+                f'SUCCESS: fixed {len(mismatches)} rows'))
+            return
+        raise CommandError(f'{len(mismatches)} inconsistent rows found')
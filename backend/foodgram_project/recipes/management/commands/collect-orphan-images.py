@@ -0,0 +1,77 @@
+import os
+import shutil
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+
+
+def scan(path):
+    '''Yield os.DirEntry of every file under path, depth first.'''
+    with os.scandir(path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                yield from scan(entry.path)
+            elif entry.is_file(follow_symlinks=False):
+                yield entry
+
+
+class Command(BaseCommand):
+    help = ('Delete or quarantine files in the recipe image directory '
+            'which no recipe refers to')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help='only report orphaned files')
+        parser.add_argument('--quarantine', metavar='DIR',
+                            help='move orphaned files to DIR instead of '
+                                 'deleting them')
+        parser.add_argument('--min-age', type=int, default=3600,
+                            metavar='SECONDS',
+                            help='skip files modified more recently, '
+                                 'they may belong to a recipe being saved')
+
+    def referenced_names(self):
+        names = set()
+        for name, renditions in Recipe.objects.exclude(
+                image='').values_list('image', 'renditions').iterator():
+            names.add(name)
+            names.update(images.rendition_files(renditions))
+        return names
+
+    def remove(self, entry, relative, quarantine):
+        if quarantine is None:
+            os.remove(entry.path)
+            return
+        target = os.path.join(quarantine, relative)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(entry.path, target)
+
+    def handle(self, *args, **options):
+        root = os.path.join(settings.MEDIA_ROOT, images.UPLOAD_TO)
+        if not os.path.isdir(root):
+            self.stdout.write(f'{root} does not exist, nothing to do')
+            return
+        # files stored after this point are too new to be collected
+        newest = time.time() - options['min_age']
+        referenced = self.referenced_names()
+        orphans = size = 0
+        for entry in scan(root):
+            relative = os.path.relpath(entry.path, settings.MEDIA_ROOT)
+            name = relative.replace(os.sep, '/')
+            stat = entry.stat(follow_symlinks=False)
+            if name in referenced or stat.st_mtime > newest:
+                continue
+            orphans += 1
+            size += stat.st_size
+            if options['verbosity'] > 1 or options['dry_run']:
+                self.stdout.write(name)
+            if not options['dry_run']:
+                self.remove(entry, relative, options['quarantine'])
+        action = ('found' if options['dry_run'] else
+                  'moved' if options['quarantine'] else 'deleted')
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: {orphans} orphaned files, '
+            f'{size / 2 ** 20:.1f} MiB {action}'))
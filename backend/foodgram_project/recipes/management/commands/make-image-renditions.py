@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from recipes import images
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Generate renditions of recipe images which have none, '
+            'e.g. uploaded before renditions were introduced')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='regenerate renditions of every recipe')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(image=None)
+        if not options['all']:
+            recipes = recipes.filter(renditions={})
+        processed = 0
+        for recipe_id, name in recipes.values_list('id',
+                                                   'image').iterator():
+            images.process_recipe_image(recipe_id, name)
+            processed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: renditions of {processed} recipe images generated'))
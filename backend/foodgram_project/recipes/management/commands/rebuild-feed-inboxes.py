@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from recipes import feed
+from recipes.models import FeedInboxEntry
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ('Rebuild materialized feed inboxes of users who follow more '
+            'than FEED_INBOX_THRESHOLD authors and drop the others')
+
+    def handle(self, *args, **options):
+        threshold = settings.FEED_INBOX_THRESHOLD
+        users = User.objects.none()
+        if threshold is not None:
+            users = User.objects.filter(following_count__gt=threshold)
+        FeedInboxEntry.objects.exclude(user__in=users).delete()
+        rebuilt = 0
+        for user in users.iterator():
+            feed.rebuild(user)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: {rebuilt} feed inboxes rebuilt'))
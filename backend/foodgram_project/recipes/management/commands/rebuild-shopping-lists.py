@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from recipes import shopping_list
+
+
+class Command(BaseCommand):
+    help = 'Recompute materialized shopping lists from carts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append',
+                            dest='user_ids',
+                            help='rebuild only the list of this user id '
+                                 '(can be repeated)')
+
+    def handle(self, *args, **options):
+        shopping_list.rebuild(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(
+            'SUCCESS: shopping lists rebuilt'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipes import counters
+
+
+class Command(BaseCommand):
+    help = ('Recompute favorites, cart, recipes and followers counters '
+            'and report how many rows drifted')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true',
+                            help='only report drift, exit with an error '
+                                 'if there is any')
+
+    def handle(self, *args, **options):
+        drift = counters.recount(fix=not options['check'])
+        for counter, rows in drift.items():
+            self.stdout.write(f'{counter}: {rows} rows drifted')
+        total = sum(drift.values())
+        if options['check'] and total:
+            raise CommandError(f'{total} counters drifted')
+        self.stdout.write(self.style.SUCCESS(
+            'SUCCESS: counters are consistent' if options['check']
+            else f'SUCCESS: fixed {total} counters'))
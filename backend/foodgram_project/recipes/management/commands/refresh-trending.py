@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from recipes import trending
+
+
+class Command(BaseCommand):
+    help = ('Update trending scores with favorites and cart additions '
+            'made since the previous run and rebuild the rankings')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='recompute all scores, this also drops '
+                                 'removed favorites and cart items')
+
+    def handle(self, *args, **options):
+        changed = trending.refresh(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f'SUCCESS: scores of {changed} recipes updated'))
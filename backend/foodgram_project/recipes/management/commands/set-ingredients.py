@@ -1,26 +1,126 @@
-import os
 import csv
+import json
+import os
+import sys
+import time
+from contextlib import nullcontext
+from itertools import islice
 
-from django.core.management.base import BaseCommand
-from foodgram_project.settings import BASE_DIR
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from recipes import versions
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(settings.BASE_DIR,
+                            'static_backend/data/ingredients.csv')
+MAX_LENGTH = Ingredient._meta.get_field('name').max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        yield tuple(row[:2]) if len(row) >= 2 else (None, None)
+
+
+def read_json(file):
+    # the standard library has no streaming parser for a JSON array,
+    # use JSON Lines for large files
+    for item in json.load(file):
+        yield item.get('name'), item.get('measurement_unit')
+
+
+def read_json_lines(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    'csv': read_csv,
+    'json': read_json,
+    'jsonl': read_json_lines,
+}
+
+
+def batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def clean(name, measurement_unit):
+    '''Stripped (name, measurement_unit), or None for an invalid row.'''
+    if not isinstance(name, str) or not isinstance(measurement_unit, str):
+        return None
+    name, measurement_unit = name.strip(), measurement_unit.strip()
+    if not name or not measurement_unit or max(
+            len(name), len(measurement_unit)) > MAX_LENGTH:
+        return None
+    return name, measurement_unit
+
 
 class Command(BaseCommand):
-    def fill_models_without_foreign_keys(self):
-        with open(os.path.join(
-                BASE_DIR, 'static_backend/data/ingredients.csv')) as csvfile:
-            fieldnames = ['name', 'measurement_unit']
-            reader = csv.DictReader(csvfile, fieldnames)
-            result = []
-            for row in reader:
-                i = Ingredient(
-                    name=row['name'], measurement_unit=row['measurement_unit'])
-                result.append(i)
-            Ingredient.objects.bulk_create(
-                result, ignore_conflicts=True)
+    help = ('Import ingredients from CSV rows "name,measurement_unit", a '
+            'JSON array or JSON Lines of {"name", "measurement_unit"}; '
+            'ingredients which already exist are skipped')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', nargs='?', default=DEFAULT_PATH,
+                            help="file to import, '-' reads stdin")
+        parser.add_argument('--format', choices=READERS,
+                            help='by default taken from the file extension, '
+                                 'csv for stdin')
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='ingredients inserted per query')
+
+    def open(self, path):
+        if path == '-':
+            return nullcontext(sys.stdin)
+        try:
+            return open(path, encoding='utf-8', newline='')
+        except OSError as error:
+            raise CommandError(error)
+
+    def import_batch(self, rows):
+        '''Insert a batch, return the number of invalid rows in it.'''
+        ingredients = {}
+        for row in rows:
+            cleaned = clean(*row)
+            if cleaned is not None:
+                ingredients[cleaned] = Ingredient(
+                    name=cleaned[0], measurement_unit=cleaned[1])
+        # the (name, measurement_unit) constraint makes reruns skip
+        # existing ingredients
+        Ingredient.objects.bulk_create(ingredients.values(),
+                                       ignore_conflicts=True)
+        return len(rows) - len(ingredients)
 
     def handle(self, *args, **options):
-        self.fill_models_without_foreign_keys()
+        path = options['path']
+        file_format = options['format'] or (
+            'csv' if path == '-'
+            else os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(f'Unknown format of {path}, use --format')
+        before = Ingredient.objects.count()
+        started = time.monotonic()
+        read = skipped = 0
+        try:
+            with self.open(path) as file:
+                for rows in batches(READERS[file_format](file),
+                                    options['batch_size']):
+                    skipped += self.import_batch(rows)
+                    read += len(rows)
+                    if options['verbosity'] >= 2:
+                        self.stdout.write(f'{read} rows read')
+        except (ValueError, AttributeError) as error:
+            raise CommandError(f'Invalid {file_format} input: {error}')
+        finally:
+            # batches imported before an error stay committed
+            versions.bump_version(versions.INGREDIENTS)
+        elapsed = max(time.monotonic() - started, 1e-6)
         self.stdout.write(self.style.SUCCESS(
-            'SUCCESS: import ingredients.csv'))
+            f'SUCCESS: {read} rows read, '
+            f'{Ingredient.objects.count() - before} ingredients added, '
+            f'{skipped} rows skipped in {elapsed:.2f} s '
+            f'({read / elapsed:.0f} rows/s)'))
@@ -0,0 +1,50 @@
+from django.db import migrations
+
+POSTGRESQL_FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (lower(name) text_pattern_ops)',
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm '
+    'ON recipes_ingredient USING gin (lower(name) gin_trgm_ops)',
+]
+POSTGRESQL_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_ingredient_name_trgm',
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix',
+]
+DEFAULT_FORWARD = [
+    'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix '
+    'ON recipes_ingredient (lower(name))',
+]
+DEFAULT_BACKWARD = [
+    'DROP INDEX IF EXISTS recipes_ingredient_name_prefix',
+]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        vendor_statements = statements.get(
+            schema_editor.connection.vendor, statements['default'])
+        for statement in vendor_statements:
+            schema_editor.execute(statement)
+    return operation
+
+
+class Migration(migrations.Migration):
+    '''
+    Indexes for the ingredient autocomplete: pattern ops index for
+    prefix search and trigram index for mid-word search. Operator
+    classes and pg_trgm are PostgreSQL only, other databases get a plain
+    index on lower(name).
+    '''
+
+    dependencies = [
+        ('recipes', '0005_shoppinglistitem'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run({'postgresql': POSTGRESQL_FORWARD,
+                 'default': DEFAULT_FORWARD}),
+            run({'postgresql': POSTGRESQL_BACKWARD,
+                 'default': DEFAULT_BACKWARD})),
+    ]
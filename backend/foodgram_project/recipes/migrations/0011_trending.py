@@ -0,0 +1,72 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:33
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def age_existing_additions(apps, schema_editor):
+    '''
+    Rows which existed before added_at got the migration time; move them
+    out of TRENDING_WINDOW, or the first refresh would rank all-time
+    popularity as if every addition had just been made.
+    '''
+    added_at = (django.utils.timezone.now() - settings.TRENDING_WINDOW
+                - timedelta(days=1))
+    for name in ('Cart', 'Favorite'):
+        apps.get_model('recipes', name).objects.update(added_at=added_at)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingScore',
+            fields=[
+                ('recipe', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_score', serialize=False, to='recipes.recipe')),
+                ('score', models.FloatField(db_index=True, verbose_name='Популярность')),
+                ('refreshed_at', models.DateTimeField(verbose_name='Дата пересчёта')),
+            ],
+            options={
+                'verbose_name': 'Популярность рецепта',
+                'verbose_name_plural': 'Популярность рецептов',
+            },
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Дата добавления'),
+        ),
+        migrations.RunPython(age_existing_additions,
+                             migrations.RunPython.noop),
+        migrations.CreateModel(
+            name='TrendingRank',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(verbose_name='Место')),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trending_ranks', to='recipes.recipe')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='trending_ranks', to='recipes.tag')),
+            ],
+            options={
+                'verbose_name': 'Место в популярных',
+                'verbose_name_plural': 'Популярные рецепты',
+                'ordering': ['tag', 'position'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='trendingrank',
+            index=models.Index(fields=['tag', 'position'], name='trending_rank_tag_position_idx'),
+        ),
+    ]
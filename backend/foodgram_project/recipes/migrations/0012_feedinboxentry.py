@@ -0,0 +1,64 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_inboxes(apps, schema_editor):
+    if settings.FEED_INBOX_THRESHOLD is None:
+        return
+    User = apps.get_model('users', 'ProfileUser')
+    Follow = apps.get_model('users', 'Follow')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FeedInboxEntry = apps.get_model('recipes', 'FeedInboxEntry')
+    users = User.objects.filter(
+        following_count__gt=settings.FEED_INBOX_THRESHOLD)
+    for user_id in users.values_list('pk', flat=True).iterator():
+        recipes = Recipe.objects.filter(author_id__in=Follow.objects.filter(
+            user_id=user_id).values('author_id'))
+        FeedInboxEntry.objects.bulk_create(
+            (FeedInboxEntry(user_id=user_id, recipe_id=pk,
+                            author_id=author_id, pub_date=pub_date)
+             for pk, author_id, pub_date in recipes.values_list(
+                 'pk', 'author_id', 'pub_date').iterator()),
+            batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipes', '0011_trending'),
+        ('users', '0003_profileuser_following_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedInboxEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('recipe', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_entries', to='recipes.recipe')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='feed_inbox', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Рецепт в ленте',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='feedinboxentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='feed_inbox_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedinboxentry',
+            index=models.Index(fields=['user', 'author'], name='feed_inbox_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='feedinboxentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='unique_recipe_in_feed_inbox'),
+        ),
+        migrations.RunPython(build_inboxes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:46
+
+from django.db import migrations, models
+
+
+def merge_rows(model, owner, keep, others):
+    '''Point rows of model at ingredient keep, summing amounts.'''
+    for row in model.objects.filter(ingredient_id__in=others):
+        kept = model.objects.filter(
+            **{owner: getattr(row, owner)}, ingredient_id=keep).first()
+        if kept is None:
+            row.ingredient_id = keep
+            row.save(update_fields=['ingredient'])
+        else:
+            kept.amount += row.amount
+            kept.save(update_fields=['amount'])
+            row.delete()
+
+
+def merge_duplicates(apps, schema_editor):
+    '''Keep the oldest of ingredients with equal name and unit.'''
+    Ingredient = apps.get_model('recipes', 'Ingredient')
+    IngredientRecipe = apps.get_model('recipes', 'IngredientRecipe')
+    ShoppingListItem = apps.get_model('recipes', 'ShoppingListItem')
+    groups = Ingredient.objects.values('name', 'measurement_unit').annotate(
+        keep=models.Min('id'), count=models.Count('id')).filter(
+        count__gt=1).order_by()
+    for group in groups.iterator():
+        others = list(Ingredient.objects.filter(
+            name=group['name'],
+            measurement_unit=group['measurement_unit']).exclude(
+            pk=group['keep']).values_list('pk', flat=True))
+        merge_rows(IngredientRecipe, 'recipe_id', group['keep'], others)
+        merge_rows(ShoppingListItem, 'user_id', group['keep'], others)
+        Ingredient.objects.filter(pk__in=others).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0012_feedinboxentry'),
+    ]
+
+    operations = [
+        # the constraint is added by a later migration: PostgreSQL cannot
+        # alter a table with deferred triggers of deleted rows pending
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+    ]
@@ -1,6 +1,7 @@
 from django.db import models
 from django.contrib.auth import get_user_model
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 
 User = get_user_model()
 
@@ -42,6 +43,10 @@ class Ingredient(models.Model):
         ordering = ["name"]
         verbose_name_plural = "Ингредиенты"
         verbose_name = "Ингредиент"
+        constraints = [
+            models.UniqueConstraint(fields=('name', 'measurement_unit'),
+                                    name='unique_ingredient_name_unit')
+        ]
 
 
 class Recipe(models.Model):
@@ -92,23 +97,32 @@ class Recipe(models.Model):
     pub_date = models.DateTimeField(
         auto_now_add=True
     )
+    # filled by recipes.images once the renditions are generated
+    renditions = models.JSONField(verbose_name='Размеры изображения',
+                                  default=dict, blank=True, editable=False)
+    # maintained by recipes.counters
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='Сколько пользователей добавили рецепт в избранное',
+        default=0, editable=False)
+    cart_count = models.PositiveIntegerField(
+        verbose_name='Сколько пользователей добавили рецепт в корзину',
+        default=0, editable=False)
 
     def __str__(self):
         return self.name
 
-    def count_users_loved_recipe(self) -> int:
-        if not self.users_favorited_currents_recipe:
-            return 0
-        return len(self.users_favorited_currents_recipe.all())
-
-    count_users_loved_recipe.short_description = ('Сколько пользователей'
-                                                  ' добавили рецепт'
-                                                  ' в избранное')
-
     class Meta:
-        ordering = ["-pub_date"]
+        ordering = ["-pub_date", "-id"]
         verbose_name_plural = "Рецепты"
         verbose_name = "Рецепт"
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date', '-id'],
+                         name='recipe_favorites_count_idx'),
+        ]
 
 
 class Cart(models.Model):
@@ -123,6 +137,9 @@ class Cart(models.Model):
         related_name='is_in_shopping_cart',
         on_delete=models.CASCADE
     )
+    # used to rank trending recipes, see recipes.trending
+    added_at = models.DateTimeField('Дата добавления', default=timezone.now,
+                                    db_index=True)
 
     class Meta:
         ordering = ['-id']
@@ -148,6 +165,9 @@ class Favorite(models.Model):
         related_name='user_favorited_currents_recipe',
         on_delete=models.CASCADE
     )
+    # used to rank trending recipes, see recipes.trending
+    added_at = models.DateTimeField('Дата добавления', default=timezone.now,
+                                    db_index=True)
 
     class Meta:
         ordering = ['-id']
@@ -179,3 +199,117 @@ class IngredientRecipe(models.Model):
 
     class Meta:
         unique_together = [['ingredient', 'recipe']]
+
+
+class ShoppingListItem(models.Model):
+    '''
+    Total amount of an ingredient over all recipes in user's cart.
+    Rows are maintained incrementally by recipes.shopping_list.
+    '''
+
+    user = models.ForeignKey(User,
+                             related_name='shopping_list',
+                             on_delete=models.CASCADE
+                             )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        related_name='shopping_list_items',
+        on_delete=models.CASCADE
+    )
+    amount = models.IntegerField(verbose_name='Количество', default=0)
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Список покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=('user', 'ingredient'),
+                name='unique_ingredient_in_shopping_list')
+        ]
+
+    def __str__(self):
+        return str(self.ingredient)
+
+
+class TrendingScore(models.Model):
+    '''
+    Time-decayed popularity of a recipe, computed by recipes.trending.
+    Only recipes with recent activity have a row.
+    '''
+
+    recipe = models.OneToOneField(Recipe, primary_key=True,
+                                  related_name='trending_score',
+                                  on_delete=models.CASCADE)
+    score = models.FloatField('Популярность', db_index=True)
+    refreshed_at = models.DateTimeField('Дата пересчёта')
+
+    class Meta:
+        verbose_name = 'Популярность рецепта'
+        verbose_name_plural = 'Популярность рецептов'
+
+
+class TrendingRank(models.Model):
+    '''
+    Precomputed top of trending recipes, overall (tag is null) and for
+    every tag.
+    '''
+
+    tag = models.ForeignKey(Tag, null=True, blank=True,
+                            related_name='trending_ranks',
+                            on_delete=models.CASCADE)
+    position = models.PositiveIntegerField('Место')
+    recipe = models.ForeignKey(Recipe, related_name='trending_ranks',
+                               on_delete=models.CASCADE)
+
+    class Meta:
+        ordering = ['tag', 'position']
+        verbose_name = 'Место в популярных'
+        verbose_name_plural = 'Популярные рецепты'
+        indexes = [
+            models.Index(fields=['tag', 'position'],
+                         name='trending_rank_tag_position_idx'),
+        ]
+
+
+class FeedInboxEntry(models.Model):
+    '''
+    Recipe of a followed author in the feed of a user who follows many
+    authors, see recipes.feed. pub_date and author are copied from the
+    recipe so the feed is read from this table's index alone.
+    '''
+
+    user = models.ForeignKey(User, related_name='feed_inbox',
+                             on_delete=models.CASCADE)
+    recipe = models.ForeignKey(Recipe, related_name='feed_entries',
+                               on_delete=models.CASCADE)
+    author = models.ForeignKey(User, related_name='+',
+                               on_delete=models.CASCADE)
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(fields=('user', 'recipe'),
+                                    name='unique_recipe_in_feed_inbox'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='feed_inbox_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='feed_inbox_user_author_idx'),
+        ]
+
+
+class DataVersion(models.Model):
+    '''
+    Version of reference data, see recipes.versions. Kept in the
+    database so that a change made by any process is seen by all.
+    '''
+
+    name = models.CharField('Данные', max_length=50, primary_key=True)
+    version = models.BigIntegerField('Версия')
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
@@ -0,0 +1,130 @@
+'''
+Incremental maintenance of the materialized shopping lists.
+
+ShoppingListItem keeps, for every user, the total amount of each
+ingredient over all recipes in the user's cart. Instead of aggregating
+the cart on every download, the totals are adjusted whenever a recipe
+is added to or removed from a cart and whenever the ingredients of a
+carted recipe change.
+'''
+from collections import defaultdict
+
+from django.db import models, transaction
+
+from .models import Cart, IngredientRecipe, ShoppingListItem
+
+
+def recipe_amounts(recipe_id):
+    '''Return {ingredient_id: amount} for a recipe.'''
+    return dict(IngredientRecipe.objects.filter(
+        recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+
+
+def apply_deltas(user_ids, deltas):
+    '''
+    Add deltas ({ingredient_id: amount}) to shopping lists of users.
+    Rows which drop to zero are removed.
+    '''
+    deltas = {ingredient_id: delta
+              for ingredient_id, delta in deltas.items() if delta}
+    user_ids = list(user_ids)
+    if not deltas or not user_ids:
+        return
+    with transaction.atomic():
+        ShoppingListItem.objects.bulk_create(
+            [ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id)
+             for user_id in user_ids
+             for ingredient_id, delta in deltas.items() if delta > 0],
+            ignore_conflicts=True)
+        items = ShoppingListItem.objects.filter(user_id__in=user_ids,
+                                                ingredient_id__in=deltas)
+        items.update(amount=models.F('amount') + models.Case(
+            *(models.When(ingredient_id=ingredient_id,
+                          then=models.Value(delta))
+              for ingredient_id, delta in deltas.items()),
+            default=models.Value(0)))
+        items.filter(amount__lte=0).delete()
+
+
+def add_recipe(user, recipe_id):
+    apply_deltas([user.pk], recipe_amounts(recipe_id))
+
+
+def remove_recipe(user, recipe_id):
+    apply_deltas([user.pk], {
+        ingredient_id: -amount
+        for ingredient_id, amount in recipe_amounts(recipe_id).items()})
+
+
+def change_recipe(recipe_id, old_amounts, new_amounts):
+    '''
+    Propagate a change of recipe ingredients to the shopping lists of
+    all users who have the recipe in their cart.
+    '''
+    deltas = {
+        ingredient_id: (new_amounts.get(ingredient_id, 0)
+                        - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in old_amounts.keys() | new_amounts.keys()}
+    apply_deltas(
+        Cart.objects.filter(recipe_id=recipe_id).values_list(
+            'user_id', flat=True),
+        deltas)
+
+
+def expected_totals(user_ids=None):
+    '''
+    Aggregate shopping lists from carts, the way they would be computed
+    without the materialized table. Yields (user_id, ingredient_id,
+    amount) ordered by user.
+    '''
+    queryset = IngredientRecipe.objects.filter(
+        recipe__is_in_shopping_cart__isnull=False)
+    if user_ids is not None:
+        queryset = queryset.filter(
+            recipe__is_in_shopping_cart__user_id__in=user_ids)
+    return queryset.values_list(
+        'recipe__is_in_shopping_cart__user_id', 'ingredient_id'
+    ).annotate(
+        total=models.Sum('amount')
+    ).order_by('recipe__is_in_shopping_cart__user_id').iterator()
+
+
+def rebuild(user_ids=None, batch_size=1000):
+    '''Recompute shopping lists of given users (all users by default).'''
+    with transaction.atomic():
+        items = ShoppingListItem.objects.all()
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        items.delete()
+        batch = []
+        for user_id, ingredient_id, amount in expected_totals(user_ids):
+            batch.append(ShoppingListItem(user_id=user_id,
+                                          ingredient_id=ingredient_id,
+                                          amount=amount))
+            if len(batch) >= batch_size:
+                ShoppingListItem.objects.bulk_create(batch)
+                batch = []
+        ShoppingListItem.objects.bulk_create(batch)
+
+
+def find_inconsistencies(user_ids=None):
+    '''
+    Compare stored shopping lists with the ones aggregated from carts.
+    Returns a list of (user_id, ingredient_id, expected, stored).
+    '''
+    expected = defaultdict(int)
+    for user_id, ingredient_id, amount in expected_totals(user_ids):
+        expected[user_id, ingredient_id] = amount
+    stored = defaultdict(int)
+    items = ShoppingListItem.objects.all()
+    if user_ids is not None:
+        items = items.filter(user_id__in=user_ids)
+    for user_id, ingredient_id, amount in items.values_list(
+            'user_id', 'ingredient_id', 'amount').iterator():
+        stored[user_id, ingredient_id] = amount
+    return sorted(
+        (user_id, ingredient_id, expected[user_id, ingredient_id],
+         stored[user_id, ingredient_id])
+        for user_id, ingredient_id in expected.keys() | stored.keys()
+        if expected[user_id, ingredient_id] != stored[user_id, ingredient_id]
+    )
@@ -0,0 +1,47 @@
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
+from django.dispatch import receiver
+
+from . import images, shopping_list, versions
+from .models import Ingredient, Recipe, Tag
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def bump_ingredients_version(sender, **kwargs):
+    versions.bump_version(versions.INGREDIENTS)
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def bump_tags_version(sender, **kwargs):
+    versions.bump_version(versions.TAGS)
+
+
+@receiver(post_save, sender=Recipe)
+def make_image_renditions(sender, instance, **kwargs):
+    if (instance.image
+            and instance.renditions.get('source') != instance.image.name):
+        images.schedule_renditions(instance)
+
+
+@receiver(pre_save, sender=Recipe)
+def discard_replaced_image(sender, instance, **kwargs):
+    if instance.pk is None:
+        return
+    old = Recipe.objects.filter(pk=instance.pk).values_list(
+        'image', 'renditions').first()
+    if old is not None and old[0] != instance.image.name:
+        images.discard(*old)
+        # renditions of the new image are made after save
+        instance.renditions = {}
+
+
+@receiver(pre_delete, sender=Recipe)
+def remove_deleted_recipe_from_shopping_lists(sender, instance, **kwargs):
+    # before the cascade deletes the cart rows and ingredients
+    shopping_list.change_recipe(
+        instance.pk, shopping_list.recipe_amounts(instance.pk), {})
+
+
+@receiver(post_delete, sender=Recipe)
+def discard_deleted_image(sender, instance, **kwargs):
+    images.discard(instance.image.name, instance.renditions)
@@ -0,0 +1,137 @@
+'''
+Trending recipes.
+
+Every favorite and cart addition adds its weight to the score of the
+recipe, and the contribution halves every TRENDING_HALF_LIFE. Scores
+are kept in TrendingScore and refreshed by the refresh-trending
+command:
+
+- incrementally: stored scores are decayed by the time elapsed since
+  the previous refresh in one UPDATE, and only additions made since
+  then are read;
+- fully (--full, or when there are no scores yet): scores are
+  recomputed from additions within TRENDING_WINDOW. This also forgets
+  favorites and cart items which were removed, which the incremental
+  refresh cannot see.
+
+After a refresh the top TRENDING_TOP_N recipes, overall and per tag,
+are written to TrendingRank, and the cached rankings are invalidated by
+bumping their version in the same transaction: versions are kept in the
+database, so web processes see the new ranking as soon as the command
+commits.
+'''
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+from . import versions
+from .models import Cart, Favorite, Recipe, Tag, TrendingRank, TrendingScore
+
+# weights of events, a cart addition means the recipe is being cooked
+SOURCES = (
+    (Favorite, 1.0),
+    (Cart, 1.5),
+)
+BATCH_SIZE = 1000
+
+
+def decay(age):
+    '''Share of an event's weight left after age (a timedelta).'''
+    return 0.5 ** (age / settings.TRENDING_HALF_LIFE)
+
+
+def event_scores(since, now):
+    '''{recipe_id: decayed weight} of additions in (since, now].'''
+    scores = defaultdict(float)
+    for model, weight in SOURCES:
+        events = model.objects.filter(
+            added_at__gt=since, added_at__lte=now).values_list(
+            'recipe_id', 'added_at')
+        for recipe_id, added_at in events.iterator():
+            scores[recipe_id] += weight * decay(now - added_at)
+    return scores
+
+
+def min_score():
+    '''Score of a single favorite at the end of the window.'''
+    return decay(settings.TRENDING_WINDOW)
+
+
+def refresh_full(now):
+    TrendingScore.objects.all().delete()
+    scores = event_scores(now - settings.TRENDING_WINDOW, now)
+    TrendingScore.objects.bulk_create(
+        (TrendingScore(recipe_id=recipe_id, score=score, refreshed_at=now)
+         for recipe_id, score in scores.items()),
+        batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def refresh_incremental(since, now):
+    TrendingScore.objects.update(score=F('score') * decay(now - since),
+                                 refreshed_at=now)
+    TrendingScore.objects.filter(score__lt=min_score()).delete()
+    scores = event_scores(since, now)
+    existing = TrendingScore.objects.in_bulk(list(scores))
+    for recipe_id, score in existing.items():
+        score.score += scores[recipe_id]
+    TrendingScore.objects.bulk_update(existing.values(), ['score'],
+                                      batch_size=BATCH_SIZE)
+    # additions to recipes deleted in the meantime are skipped
+    new_ids = Recipe.objects.filter(
+        pk__in=[pk for pk in scores if pk not in existing]).values_list(
+        'pk', flat=True)
+    TrendingScore.objects.bulk_create(
+        (TrendingScore(recipe_id=pk, score=scores[pk], refreshed_at=now)
+         for pk in new_ids),
+        batch_size=BATCH_SIZE)
+    return len(scores)
+
+
+def rank():
+    '''Rewrite TrendingRank from the current scores.'''
+    top = settings.TRENDING_TOP_N
+    scores = TrendingScore.objects.order_by('-score', '-recipe_id')
+    ranks = [TrendingRank(tag=None, position=position, recipe_id=pk)
+             for position, pk in enumerate(
+                 scores.values_list('recipe_id', flat=True)[:top], 1)]
+    for tag in Tag.objects.all():
+        tagged = scores.filter(recipe__tags=tag).values_list(
+            'recipe_id', flat=True)[:top]
+        ranks.extend(TrendingRank(tag=tag, position=position, recipe_id=pk)
+                     for position, pk in enumerate(tagged, 1))
+    TrendingRank.objects.all().delete()
+    TrendingRank.objects.bulk_create(ranks, batch_size=BATCH_SIZE)
+
+
+def refresh(full=False, now=None):
+    '''
+    Refresh scores and rankings, return the number of recipes whose
+    score was recomputed.
+    '''
+    now = now or timezone.now()
+    with transaction.atomic():
+        since = TrendingScore.objects.aggregate(
+            since=Max('refreshed_at'))['since']
+        if full or since is None:
+            changed = refresh_full(now)
+        else:
+            changed = refresh_incremental(since, now)
+        rank()
+        versions.bump_version(versions.TRENDING)
+    return changed
+
+
+def ranked_ids(tag_id=None):
+    '''Ids of top recipes, overall or for a tag, best first.'''
+    key = f'trending:{versions.get_version(versions.TRENDING)}:{tag_id}'
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(TrendingRank.objects.filter(tag_id=tag_id).order_by(
+            'position').values_list('recipe_id', flat=True))
+        cache.set(key, ids, settings.REFERENCE_DATA_CACHE_TIMEOUT)
+    return ids
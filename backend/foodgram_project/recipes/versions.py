@@ -0,0 +1,50 @@
+'''
+Version counters of reference data kept in the database.
+
+Processes which hold derived data (the ingredient search index, cached
+API responses) compare the version they were built from with the
+current one and rebuild when it changed. Versions are bumped by model
+signals and by bulk operations which bypass signals, such as the
+ingredient import. They are rows of DataVersion rather than cache
+entries, so a bump made by a management command run in its own process
+reaches every gunicorn worker whatever the cache backend is, and a bump
+made in a transaction which is rolled back is undone with it.
+
+A version is the time of the change in nanoseconds, so it doubles as
+Last-Modified. A missing row is created with the current time, which no
+process has seen before.
+'''
+import time
+
+from foodgram_project.db import insert_ignore
+
+from .models import DataVersion
+
+INGREDIENTS = 'ingredients'
+TAGS = 'tags'
+TRENDING = 'trending'
+
+
+def get_version(name):
+    version = DataVersion.objects.filter(name=name).values_list(
+        'version', flat=True).first()
+    if version is None:
+        # another process may create the row at the same time
+        insert_ignore(DataVersion, name=name, version=time.time_ns())
+        version = DataVersion.objects.values_list(
+            'version', flat=True).get(name=name)
+    return version
+
+
+def bump_version(name):
+    version = time.time_ns()
+    versions = DataVersion.objects.filter(name=name)
+    if (not versions.update(version=version)
+            and not insert_ignore(DataVersion, name=name, version=version)):
+        versions.update(version=version)
+    return version
+
+
+def last_modified(version):
+    '''Unix timestamp of the change which produced version.'''
+    return version // 10 ** 9
@@ -0,0 +1,29 @@
+# Generated by Django 4.1.7 on 2026-10-18 20:36
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_following_count(apps, schema_editor):
+    User = apps.get_model('users', 'ProfileUser')
+    Follow = apps.get_model('users', 'Follow')
+    User.objects.update(following_count=Coalesce(models.Subquery(
+        Follow.objects.filter(user=models.OuterRef('pk')).order_by().values(
+            'user').annotate(count=models.Count('pk')).values('count')), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_profileuser_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profileuser',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество подписок'),
+        ),
+        migrations.RunPython(fill_following_count,
+                             migrations.RunPython.noop),
+    ]
@@ -22,6 +22,13 @@ class ProfileUser(AbstractUser):
     follow = models.ManyToManyField(
         'self', related_name='followers',
         blank=True, through='Follow')
+    # maintained by recipes.counters
+    recipes_count = models.PositiveIntegerField(
+        'Количество рецептов', default=0, editable=False)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0, editable=False)
+    following_count = models.PositiveIntegerField(
+        'Количество подписок', default=0, editable=False)
 
     class Meta:
         ordering = ["email"]
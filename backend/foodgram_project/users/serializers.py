@@ -2,7 +2,7 @@ from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from djoser.serializers import UserCreateSerializer
 
-from .models import Follow
+from api.relations import context_relations
 
 User = get_user_model()
 
@@ -22,7 +22,6 @@ class UserManageSerializer(
                         'id': {'read_only': True}}
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
-        if user.is_anonymous:
-            return False
-        return Follow.objects.filter(user=user, author=obj.id).exists()
+        if hasattr(obj, 'annotated_is_subscribed'):
+            return obj.annotated_is_subscribed
+        return obj.id in context_relations(self.context).following